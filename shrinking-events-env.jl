@@ -7,6 +7,11 @@ using Statistics
 df_events = CSV.read("input/shrinking-events.csv", DataFrame)
 df = CSV.read("input/daily_data_with_trends.csv", DataFrame)
 
+# Ids as plain Strings: CSV.jl reads them as InlineStrings whose width depends
+# on the file, and they are compared and used as climatology keys across files
+df_events.id = String.(df_events.id)
+df.id = String.(df.id)
+
 # Convert date column and sort
 df.date = Date.(df.date)
 sort!(df, [:id, :date])
@@ -20,10 +25,69 @@ df.doy = dayofyear.(df.date)
 # Drop rows with missing D_mean
 df = df[.!ismissing.(df.D_mean), :]
 
+window_stat(func::String, x) = func == "sum" ? sum(x) :
+                                func == "mean" ? mean(x) :
+                                func == "max" ? maximum(x) :
+                                func == "min" ? minimum(x) :
+                                error("Invalid function: $func")
+
+# Day-of-year climatology of every id and variable: per year of the id the
+# values by day of year (missing where there is none) and their cumulative
+# sums and counts, so the normal of a window is a few lookups per year
+const Climatology = @NamedTuple{values::Matrix{Union{Missing, Float64}}, sums::Matrix{Float64}, counts::Matrix{Int}}
+
+function build_climatology(df::DataFrame, env_vars::Vector{Symbol})
+    climatology = Dict{Tuple{String, Symbol}, Climatology}()
+    
+    for id_group in groupby(df, :id)
+        years = sort(unique(id_group.year))
+        year_row = Dict(y => i for (i, y) in enumerate(years))
+        
+        for env in env_vars
+            values = Matrix{Union{Missing, Float64}}(missing, length(years), 366)
+            for (y, d, v) in zip(id_group.year, id_group.doy, id_group[!, env])
+                values[year_row[y], d] = v
+            end
+            
+            sums = hcat(zeros(length(years)), cumsum(coalesce.(values, 0.0), dims=2))
+            counts = hcat(zeros(Int, length(years)), cumsum(.!ismissing.(values), dims=2))
+            climatology[(String(first(id_group.id)), env)] = (values = values, sums = sums, counts = counts)
+        end
+    end
+    return climatology
+end
+
+# Mean over the years of the statistic over the days of year start_doy to
+# end_doy - 1 (wrapping around the year end), for the percentages of normal;
+# missing if no year has values
+function climatology_normal(clim::Climatology, func::String, start_doy::Int, end_doy::Int)
+    doy_ranges = start_doy < end_doy ? [start_doy:end_doy-1] : [start_doy:366, 1:end_doy-1]
+    year_stats = Float64[]
+    
+    for y in axes(clim.values, 1)
+        count = sum(clim.counts[y, last(r)+1] - clim.counts[y, first(r)] for r in doy_ranges)
+        count == 0 && continue
+        
+        if func == "sum" || func == "mean"
+            total = sum(clim.sums[y, last(r)+1] - clim.sums[y, first(r)] for r in doy_ranges)
+            push!(year_stats, func == "sum" ? total : total / count)
+        else
+            year_values = Iterators.flatten(view(clim.values, y, r) for r in doy_ranges)
+            push!(year_stats, window_stat(func, skipmissing(year_values)))
+        end
+    end
+    
+    return isempty(year_stats) ? missing : mean(year_stats)
+end
+
+# Aggregate env over the n days before each date with all functions at once,
+# so the window is filtered once per event. Percentages of normal relate the
+# value to the normal of the same days of year (see climatology_normal).
 function calculate_before_shrinking(df::DataFrame, ids::Vector, dates::Vector, 
-                                   n::Int, env::Symbol, func::String="sum", 
-                                   as_percentage::Bool=false)
-    results = Vector{Union{Missing, Float64}}(undef, length(ids))
+                                   n::Int, env::Symbol, funcs::Vector{String}, 
+                                   as_percentage::Bool=false,
+                                   climatology::Union{Dict{Tuple{String, Symbol}, Climatology}, Nothing}=nothing)
+    results = Dict(func => Vector{Union{Missing, Float64}}(missing, length(ids)) for func in funcs)
     
     for (i, (id_val, date)) in enumerate(zip(ids, dates))
         start_date = date - Day(n)
@@ -36,163 +100,28 @@ function calculate_before_shrinking(df::DataFrame, ids::Vector, dates::Vector,
                  (df.date .>= start_date) .& 
                  (df.date .< end_date), :]
         
-        # Calculate the value for this specific window
-        if func == "sum"
-            if isempty(sub) || all(ismissing.(sub[!, env]))
-                results[i] = missing
-            else
-                val = sum(skipmissing(sub[!, env]))
-                
-                if as_percentage
-                    id_data = df[df.id .== id_val, :]
-                    
-                    if start_doy < end_doy
-                        historical_data = id_data[(id_data.doy .>= start_doy) .& (id_data.doy .< end_doy), :]
-                    else
-                        historical_data = id_data[(id_data.doy .>= start_doy) .| (id_data.doy .< end_doy), :]
-                    end
-                    
-                    if !isempty(historical_data)
-                        year_sums = Float64[]
-                        for year_group in groupby(historical_data, :year)
-                            if !all(ismissing.(year_group[!, env]))
-                                push!(year_sums, sum(skipmissing(year_group[!, env])))
-                            end
-                        end
-                        
-                        if !isempty(year_sums)
-                            avg_val = mean(year_sums)
-                            results[i] = avg_val == 0 ? missing : (val / avg_val) * 100
-                        else
-                            results[i] = missing
-                        end
-                    else
-                        results[i] = missing
-                    end
-                else
-                    results[i] = val
-                end
-            end
-        elseif func == "mean"
-            if isempty(sub) || all(ismissing.(sub[!, env]))
-                results[i] = missing
-            else
-                val = mean(skipmissing(sub[!, env]))
-                
-                if as_percentage
-                    id_data = df[df.id .== id_val, :]
-                    
-                    if start_doy < end_doy
-                        historical_data = id_data[(id_data.doy .>= start_doy) .& (id_data.doy .< end_doy), :]
-                    else
-                        historical_data = id_data[(id_data.doy .>= start_doy) .| (id_data.doy .< end_doy), :]
-                    end
-                    
-                    if !isempty(historical_data)
-                        year_means = Float64[]
-                        for year_group in groupby(historical_data, :year)
-                            if !all(ismissing.(year_group[!, env]))
-                                push!(year_means, mean(skipmissing(year_group[!, env])))
-                            end
-                        end
-                        
-                        if !isempty(year_means)
-                            avg_val = mean(year_means)
-                            results[i] = avg_val == 0 ? missing : (val / avg_val) * 100
-                        else
-                            results[i] = missing
-                        end
-                    else
-                        results[i] = missing
-                    end
-                else
-                    results[i] = val
-                end
-            end
-        elseif func == "max"
-            if isempty(sub) || all(ismissing.(sub[!, env]))
-                results[i] = missing
-            else
-                val = maximum(skipmissing(sub[!, env]))
-                
-                if as_percentage
-                    id_data = df[df.id .== id_val, :]
-                    
-                    if start_doy < end_doy
-                        historical_data = id_data[(id_data.doy .>= start_doy) .& (id_data.doy .< end_doy), :]
-                    else
-                        historical_data = id_data[(id_data.doy .>= start_doy) .| (id_data.doy .< end_doy), :]
-                    end
-                    
-                    if !isempty(historical_data)
-                        year_maxs = Float64[]
-                        for year_group in groupby(historical_data, :year)
-                            if !all(ismissing.(year_group[!, env]))
-                                push!(year_maxs, maximum(skipmissing(year_group[!, env])))
-                            end
-                        end
-                        
-                        if !isempty(year_maxs)
-                            avg_val = mean(year_maxs)
-                            results[i] = avg_val == 0 ? missing : (val / avg_val) * 100
-                        else
-                            results[i] = missing
-                        end
-                    else
-                        results[i] = missing
-                    end
-                else
-                    results[i] = val
-                end
-            end
-        elseif func == "min"
-            if isempty(sub) || all(ismissing.(sub[!, env]))
-                results[i] = missing
-            else
-                val = minimum(skipmissing(sub[!, env]))
-                
-                if as_percentage
-                    id_data = df[df.id .== id_val, :]
-                    
-                    if start_doy < end_doy
-                        historical_data = id_data[(id_data.doy .>= start_doy) .& (id_data.doy .< end_doy), :]
-                    else
-                        historical_data = id_data[(id_data.doy .>= start_doy) .| (id_data.doy .< end_doy), :]
-                    end
-                    
-                    if !isempty(historical_data)
-                        year_mins = Float64[]
-                        for year_group in groupby(historical_data, :year)
-                            if !all(ismissing.(year_group[!, env]))
-                                push!(year_mins, minimum(skipmissing(year_group[!, env])))
-                            end
-                        end
-                        
-                        if !isempty(year_mins)
-                            avg_val = mean(year_mins)
-                            results[i] = avg_val == 0 ? missing : (val / avg_val) * 100
-                        else
-                            results[i] = missing
-                        end
-                    else
-                        results[i] = missing
-                    end
-                else
-                    results[i] = val
-                end
-            end
-        elseif func == "time_min"
-            if isempty(sub) || all(ismissing.(sub[!, env]))
-                results[i] = missing
-            else
+        if isempty(sub) || all(ismissing.(sub[!, env]))
+            continue
+        end
+        
+        for func in funcs
+            if func == "time_min"
                 valid_rows = .!ismissing.(sub[!, env])
                 valid_sub = sub[valid_rows, :]
                 min_idx = argmin(valid_sub[!, env])
                 min_date = valid_sub.date[min_idx]
-                results[i] = (end_date - min_date).value
+                results[func][i] = (end_date - min_date).value
+                continue
+            end
+            
+            val = window_stat(func, skipmissing(sub[!, env]))
+            
+            if as_percentage
+                avg_val = climatology_normal(climatology[(String(id_val), env)], func, start_doy, end_doy)
+                results[func][i] = ismissing(avg_val) || avg_val == 0 ? missing : (val / avg_val) * 100
+            else
+                results[func][i] = val
             end
-        else
-            error("Invalid function: $func")
         end
     end
     
@@ -225,6 +154,8 @@ shrinking_df = DataFrame(
 env_vars = [:AT_mean, :ST_mean, :SM_mean]
 env_names = ["AT", "ST", "SM"]
 
+climatology = build_climatology(df, env_vars)
+
 
 configurations = [
     (3, ["sum", "mean", "max", "min", "time_min"], ["start", "stop", "recovery"], [false]),
@@ -247,104 +178,68 @@ configurations = [
     (1095, ["sum", "mean", "max", "min", "time_min"], ["start", "stop", "recovery"], [true])
 ]
 
-# Generate all columns
+# Expand the configurations into one entry per feature (function, variable,
+# timepoint and percentage flag), each once
+features = unique([
+    (n = n, func = func, env = env_idx, timepoint = timepoint, pct = use_pct)
+    for (n, funcs, timepoints, pct_options) in configurations
+    for func in funcs
+    for env_idx in eachindex(env_vars)
+    for timepoint in timepoints
+    for use_pct in pct_options
+])
+
+anchors = Dict("start" => start_shrink, "stop" => stop_shrink, "recovery" => recovery)
+
+feature_name(f) = "$(f.func)_$(env_names[f.env])_$(f.n)_$(f.timepoint)$(f.pct ? "_pct" : "")"
+
+# Calculate all functions of a window (length, variable, timepoint, percentage flag) together
 println("Generating calculated columns...")
-for (n, funcs, timepoints, pct_options) in configurations
+feature_values = Dict{eltype(features), Vector{Union{Missing, Float64}}}()
+for window in unique([(f.n, f.env, f.timepoint, f.pct) for f in features])
+    n, env_idx, timepoint, use_pct = window
+    haskey(anchors, timepoint) || error("Unknown timepoint: $timepoint")
+    
+    funcs = unique([f.func for f in features if (f.n, f.env, f.timepoint, f.pct) == window])
+    results = calculate_before_shrinking(
+        df, event_ids, anchors[timepoint], n, env_vars[env_idx], funcs, use_pct, climatology
+    )
     for func in funcs
-        for (env_idx, env) in enumerate(env_vars)
-            env_name = env_names[env_idx]
-            
-            for timepoint in timepoints
-                dates = if timepoint == "start"
-                    start_shrink
-                elseif timepoint == "stop"
-                    stop_shrink
-                elseif timepoint == "recovery"
-                    recovery
-                else
-                    error("Unknown timepoint: $timepoint")
-                end
-                
-                for use_pct in pct_options
-                    col_name = if use_pct
-                        "$(func)_$(env_name)_$(n)_$(timepoint)_pct"
-                    else
-                        "$(func)_$(env_name)_$(n)_$(timepoint)"
-                    end
-                    
-                    col_symbol = Symbol(col_name)
-                    shrinking_df[!, col_symbol] = calculate_before_shrinking(
-                        df, event_ids, dates, n, env, func, use_pct
-                    )
-                end
-            end
-        end
+        feature_values[(n = n, func = func, env = env_idx, timepoint = timepoint, pct = use_pct)] = results[func]
     end
 end
 
+for f in features
+    shrinking_df[!, Symbol(feature_name(f))] = feature_values[f]
+end
+
 # save
 println("\nFirst rows of result:")
 println(first(shrinking_df, 5))
 CSV.write("input/shrinking-events-env.csv", shrinking_df)
 println("\nSaved to input/shrinking-events-env.csv")
 
-# Create long format version
-println("\nCreating long format...")
+# Long format: the base columns and one block of rows per feature, written
+# feature by feature instead of reshaping the wide table
+println("\nWriting long format...")
 base_cols = [:id, :year, :start, :stop, :recovery, :shrink_days, :total_days, 
              :start_doy, :end_doy, :recovery_doy, :total_shrink, :shrink_pct, :depth]
 
-long_data = DataFrame()
-calc_cols = setdiff(names(shrinking_df), String.(base_cols))
-
-for col in calc_cols
-    global long_data
-    
-    parts = split(col, "_")
-    is_pct = (length(parts) > 0 && parts[end] == "pct")
+base_df = select(shrinking_df, base_cols)
+for (k, f) in enumerate(features)
+    block = copy(base_df)
+    block.env = fill(env_names[f.env], nrow(block))
+    block.n = fill(f.n, nrow(block))
+    block.func = fill(f.func, nrow(block))
+    block.timepoint = fill(f.timepoint, nrow(block))
+    block.pct = fill(f.pct, nrow(block))
+    block.value = feature_values[f]
     
-    if is_pct
-        parts = parts[1:end-1]
-    end
-    
-    if length(parts) >= 4
-        func = parts[1]
-        
-        if func == "time" && parts[2] == "min"
-            func = "time_min"
-            env = parts[3]
-            n = parts[4]
-            timepoint = join(parts[5:end], "_")
-        else
-            env = parts[2]
-            n = parts[3]
-            timepoint = join(parts[4:end], "_")
-        end
-        
-        try
-            n_int = parse(Int, n)
-            
-            temp_df = select(shrinking_df, base_cols..., col => :value)
-            temp_df.env = fill(env, nrow(temp_df))
-            temp_df.n = fill(n_int, nrow(temp_df))
-            temp_df.func = fill(func, nrow(temp_df))
-            temp_df.timepoint = fill(timepoint, nrow(temp_df))
-            temp_df.pct = fill(is_pct, nrow(temp_df))
-            
-            if isempty(long_data)
-                long_data = temp_df
-            else
-                long_data = vcat(long_data, temp_df)
-            end
-        catch e
-            println("Skipping column $col - could not parse: $e")
-        end
+    if k == 1
+        println("\nLong format preview:")
+        println(first(block, 10))
     end
+    CSV.write("input/shrinking-events-env-long.csv", block; append = k > 1)
 end
 
-long_data = select(long_data, base_cols..., :env, :n, :func, :timepoint, :pct, :value)
-
-println("\nLong format preview:")
-println(first(long_data, 10))
-
-CSV.write("input/shrinking-events-env-long.csv", long_data)
-println("\nLong format saved to input/shrinking-events-env-long.csv")
\ No newline at end of file
+println("\nLong format saved to input/shrinking-events-env-long.csv")
@@ -48,15 +48,53 @@ end
 
 println("Data loaded: $(nrow(df)) rows for $(length(unique(df.id))) unique IDs")
 
+function max_sparse_table(values::AbstractVector{Float64})
+    """
+    Sparse table of range maxima: row k holds the maximum of the 2^(k-1) values
+    starting at each position (-Inf where the block runs past the end).
+    """
+    n = length(values)
+    n_levels = n > 0 ? floor(Int, log2(n)) + 1 : 1
+    table = fill(-Inf, n_levels, n)
+    table[1, :] .= values
+    for k in 2:n_levels
+        half = 1 << (k - 2)
+        for i in 1:(n - (1 << (k - 1)) + 1)
+            table[k, i] = max(table[k-1, i], table[k-1, i+half])
+        end
+    end
+    return table
+end
+
+function first_at_least(table::Matrix{Float64}, a::Int, b::Int, threshold::Float64)
+    """
+    First index j in a:b with values[j] >= threshold (0 if there is none), by
+    binary lifting over the sparse table of range maxima in O(log n).
+    """
+    a > b && return 0
+    pos = a
+    for k in min(size(table, 1), floor(Int, log2(b - a + 1)) + 1):-1:1
+        width = 1 << (k - 1)
+        if pos + width - 1 <= b && table[k, pos] < threshold
+            pos += width
+        end
+    end
+    return pos <= b && table[1, pos] >= threshold ? pos : 0
+end
+
 function detect_shrinking_events(dates::AbstractVector{Date}, values::AbstractVector{Float64}, 
                                  amp::Float64; min_shrink_pct::Float64=MIN_SHRINK_PCT, 
-                                 recovery_pct::Float64=RECOVERY_PCT)
+                                 recovery_pct::Float64=RECOVERY_PCT,
+                                 max_table::Union{Matrix{Float64},Nothing}=nothing, offset::Int=0)
     """
     Detect shrinking events with configurable thresholds.
+    max_table is the sparse table of range maxima of the whole series (built
+    here if not given) and values[k] is position offset + k of that series.
     """
     if isnan(amp) || amp == 0
         return DataFrame()
     end
+    table = isnothing(max_table) ? max_sparse_table(values) : max_table
 
     threshold = amp * (min_shrink_pct / 100.0)
     println("  Detecting events: min shrink = $(round(threshold, digits=2)) units ($(min_shrink_pct)%), recovery = $(recovery_pct)%")
@@ -132,14 +170,10 @@ function detect_shrinking_events(dates::AbstractVector{Date}, values::AbstractVe
                     recovery_idx = min_idx
                     recovery_val = min_val
 
-                    k = min_idx + 1
-                    while k <= n
-                        if values[k] >= recovery_threshold
-                            recovery_idx = k
-                            recovery_val = values[k]
-                            break
-                        end
-                        k += 1
+                    k = first_at_least(table, offset + min_idx + 1, offset + n, recovery_threshold)
+                    if k > 0
+                        recovery_idx = k - offset
+                        recovery_val = values[recovery_idx]
                     end
 
                     if recovery_idx == min_idx && min_idx < n
@@ -186,16 +220,23 @@ end
 # Recursive function with depth-specific parameters
 function detect_nested_events(id_val, dates, values, amp::Float64,
                               depth::Int=0, parent_start::Union{Date,Nothing}=nothing,
-                              max_depth::Int=MAX_NESTING_DEPTH)
+                              max_depth::Int=MAX_NESTING_DEPTH;
+                              max_table::Union{Matrix{Float64},Nothing}=nothing, offset::Int=0)
     """
     Recursively detect shrinking events at increasing depths.
     Uses different parameters for outer vs nested events.
+    The sparse table of range maxima of the series is built once and shared
+    by all depths (offset: position of the first value within the series).
     """
     
     id_val = String(id_val)
     dates = collect(dates)
     values = collect(values)
-    
+    max_table = isnothing(max_table) ? max_sparse_table(values) : max_table
+    # values[k] must be position offset + k of the series of max_table
+    @assert isempty(values) || (max_table[1, offset + 1] == first(values) &&
+                                max_table[1, offset + length(values)] == last(values))
+
     all_events = DataFrame(
         id=String[],
         year=Int[],
@@ -230,7 +271,9 @@ function detect_nested_events(id_val, dates, values, amp::Float64,
     # Detect events at current level with appropriate parameters
     events = detect_shrinking_events(dates, values, amp, 
                                      min_shrink_pct=min_shrink,
-                                     recovery_pct=recovery)
+                                     recovery_pct=recovery,
+                                     max_table=max_table,
+                                     offset=offset)
     
     # Process each event
     for row in eachrow(events)
@@ -282,7 +325,9 @@ function detect_nested_events(id_val, dates, values, amp::Float64,
                 event_amp,
                 depth + 1,
                 row.start_date,
-                max_depth
+                max_depth;
+                max_table=max_table,
+                offset=offset + row.end_idx - 1
             )
             
             filtered_nested = filter(nested) do n
@@ -323,13 +368,23 @@ all_events = DataFrame(
     parent_start=Union{Date,Missing}[]
 )
 
-for g in groupby(df, :id)
+# IDs are independent: detect them on all threads (start Julia with `julia -t auto`)
+# and append the results in ID order, so the output does not depend on the thread count
+println("Using $(Threads.nthreads()) threads")
+id_groups = collect(groupby(df, :id))
+id_events = Vector{DataFrame}(undef, length(id_groups))
+
+Threads.@threads for k in eachindex(id_groups)
+    g = id_groups[k]
     id_val = first(g.id)
     dates = g.date
     values = g.D_mean
     amp = first(g.amp)
     
-    events = detect_nested_events(id_val, dates, values, amp, 0, nothing, MAX_NESTING_DEPTH)
+    id_events[k] = detect_nested_events(id_val, dates, values, amp, 0, nothing, MAX_NESTING_DEPTH)
+end
+
+for events in id_events
     append!(all_events, events)
 end
 
@@ -2,9 +2,9 @@ import pandas as pd
 from scipy.stats import linregress
 
 exec(open('src/constants/palettes.py').read())
+exec(open('src/services/data-store.py').read())
 
-df = pd.read_csv("input/daily_data.csv")
-df["date"] = pd.to_datetime(df["date"])
+df = load_table("daily_data")
 df = df.sort_values(["id", "date"])
 
 df["year"] = df["date"].dt.year
@@ -42,4 +42,7 @@ for name, group in df.groupby("id"):
     print(group["normalized"])
     break
 
+write_table(df, "daily_data_with_trends")
+
+# the Julia scripts still read the CSV export
 df.to_csv("input/daily_data_with_trends.csv", index=False)
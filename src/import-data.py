@@ -1,66 +1,135 @@
-from functools import reduce
-import pandas as pd
+import os
+import shutil
 import duckdb
+import pandas as pd
 
+exec(open('src/services/data-store.py').read())
+exec(open('src/services/sensor-ids.py').read())
+exec(open('src/services/database.py').read())
 
 filepath = 'input/Shrinking_Emp.h__D_AT_ST_SM_Coord__2009_2024__JL054__f_Svenja05.xlsx'
-
-dfD = pd.read_excel(filepath, sheet_name='D')
-
-dfAT = pd.read_excel(filepath, sheet_name='AT')
-
-dfST = pd.read_excel(filepath, sheet_name='ST')
-
-dfSM = pd.read_excel(filepath, sheet_name='SM')
-
-dfD_long = dfD.melt(
-    id_vars=["datetime"],
-    var_name="id",
-    value_name="D"
-)
-
-split_cols = dfD_long["id"].str.split(".", expand=True)
-
-split_cols.columns = ["country", "site", "individuum", "branch", "section", "radius"]
-
-dfD_long = pd.concat([dfD_long[["datetime", "D", "id"]], split_cols[["site"]]], axis=1)
-
-print("Dendrometer data transposed to long format.")
-
-env = [dfAT, dfST, dfSM]
-
-env_long = [
-    df.melt(id_vars=["datetime"], var_name="site", value_name=f"env{i+1}")
-    for i, df in enumerate(env)
-]
-
-print("Environmental data transposed to long format.")
-
-env_df = reduce(
-    lambda left, right: left.merge(right, on=["datetime", "site"], how="left"),
-    env_long
-)
-
-print("Environmental data merged")
-
-con = duckdb.connect()
-con.register("dfD_long", dfD_long)
-con.register("env_df", env_df)
-
-df_final = con.execute("""
-    SELECT d.*, e.*
-    FROM dfD_long d
-    LEFT JOIN env_df e
-    ON d.datetime = e.datetime AND d.site = e.site
+# long-format measurements are loaded into the 'measurements' table of the DuckDB database (database_path)
+
+# "duckdb": read, transpose and join the sheets in one DuckDB query
+# "stream": stream the workbook in chunks into input/raw/ (Parquet, partitioned by sheet and year)
+ingest_mode = "duckdb"
+raw_dir = "input/raw"
+
+# Append only rows newer than the last ingested timestamp of each sensor id.
+# Falls back to a full rebuild when there is no previous output or watermark.
+incremental = False
+watermark_path = "input/ingest-watermark.csv"
+dirty_dir = "input/dirty"
+
+incremental = incremental and os.path.exists(database_path) and os.path.exists(watermark_path)
+
+if ingest_mode == "stream":
+    exec(open('src/services/stream-excel.py').read())
+
+    stream_workbook_to_parquet(
+        filepath,
+        raw_dir,
+        sheets={"D": "id", "AT": "site", "ST": "site", "SM": "site"}
+    )
+
+    sources = {
+        "D": f"read_parquet('{raw_dir}/sheet=D/*/*.parquet')",
+        "AT": f"read_parquet('{raw_dir}/sheet=AT/*/*.parquet')",
+        "ST": f"read_parquet('{raw_dir}/sheet=ST/*/*.parquet')",
+        "SM": f"read_parquet('{raw_dir}/sheet=SM/*/*.parquet')",
+    }
+else:
+    # D keeps empty cells so that every logged timestamp of a dendrometer stays in the output
+    sources = {
+        "D": f"""(FROM read_xlsx('{filepath}', sheet='D')
+                 UNPIVOT INCLUDE NULLS ("D" FOR id IN (COLUMNS(* EXCLUDE (datetime)))))""",
+        "AT": f"""(FROM read_xlsx('{filepath}', sheet='AT')
+                  UNPIVOT ("AT" FOR site IN (COLUMNS(* EXCLUDE (datetime)))))""",
+        "ST": f"""(FROM read_xlsx('{filepath}', sheet='ST')
+                  UNPIVOT ("ST" FOR site IN (COLUMNS(* EXCLUDE (datetime)))))""",
+        "SM": f"""(FROM read_xlsx('{filepath}', sheet='SM')
+                  UNPIVOT ("SM" FOR site IN (COLUMNS(* EXCLUDE (datetime)))))""",
+    }
+
+con = connect_database()
+
+if incremental:
+    watermark_filter = f"""
+        LEFT JOIN read_csv('{watermark_path}', header=true,
+                           columns={{'id': 'VARCHAR', 'last_datetime': 'TIMESTAMP'}}) w
+            ON d.id = w.id
+        WHERE w.last_datetime IS NULL OR d.datetime > w.last_datetime
+    """
+else:
+    watermark_filter = ""
+
+con.execute(f"""
+    CREATE OR REPLACE TEMP TABLE new_rows AS
+        WITH d AS (
+            SELECT CAST(datetime AS TIMESTAMP) AS datetime,
+                   split_part(id, '.', 2) AS site,
+                   id,
+                   TRY_CAST("D" AS DOUBLE) AS "D"
+            FROM {sources["D"]}
+        ),
+        e1 AS (SELECT CAST(datetime AS TIMESTAMP) AS datetime, site, TRY_CAST("AT" AS DOUBLE) AS "AT" FROM {sources["AT"]}),
+        e2 AS (SELECT CAST(datetime AS TIMESTAMP) AS datetime, site, TRY_CAST("ST" AS DOUBLE) AS "ST" FROM {sources["ST"]}),
+        e3 AS (SELECT CAST(datetime AS TIMESTAMP) AS datetime, site, TRY_CAST("SM" AS DOUBLE) AS "SM" FROM {sources["SM"]})
+        SELECT d.datetime, d.id, d.site, d."D", e1."AT", e2."ST", e3."SM"
+        FROM d
+        LEFT JOIN e1 ON d.datetime = e1.datetime AND d.site = e1.site
+        LEFT JOIN e2 ON d.datetime = e2.datetime AND d.site = e2.site
+        LEFT JOIN e3 ON d.datetime = e3.datetime AND d.site = e3.site
+        {watermark_filter}
+""")
+
+new_rows = con.execute(f"""
+    SELECT id, MIN(datetime) AS since, MAX(datetime) AS last_datetime
+    FROM new_rows
+    GROUP BY id
 """).df()
 
-df_final = df_final.rename(columns={
-    "env1": "AT",
-    "env2": "ST",
-    "env3": "SM"
-})
-
-df_final = df_final[["datetime",  "site", "id", "D", "AT", "ST", "SM"]]
-
-print(df_final)
-df_final.to_csv("input/input.csv", index=False)
+# sensor dimension: every id is parsed once here, later stages join on the integer id_code
+sensors = None
+if incremental and os.path.isdir(store_path("sensors")):
+    sensors = load_table("sensors")
+sensors = build_sensor_table(new_rows["id"], sensors)
+write_table(sensors, "sensors", partition_cols=())
+con.register("sensors", sensors[["id", "id_code"]])
+
+if not incremental:
+    create_measurements_table(con)
+
+# rows are inserted sorted by sensor and time so that DuckDB can skip row groups when filtering on them
+con.execute("""
+    INSERT INTO measurements BY NAME
+    SELECT n.datetime, s.id_code, YEAR(n.datetime) AS year, n."D", n."AT", n."ST", n."SM"
+    FROM new_rows n
+    JOIN sensors s USING (id)
+    ORDER BY s.id_code, n.datetime
+""")
+con.close()
+
+if incremental:
+
+    watermark = pd.concat([pd.read_csv(watermark_path, parse_dates=["last_datetime"]),
+                           new_rows[["id", "last_datetime"]]])
+    watermark = watermark.groupby("id", as_index=False)["last_datetime"].max()
+
+    # every downstream stage keeps its own list of ids and the first timestamp it has to recompute
+    os.makedirs(dirty_dir, exist_ok=True)
+    for target in ["aggregates", "daily_data", "monthly_data"]:
+        dirty_path = os.path.join(dirty_dir, f"{target}.csv")
+        dirty = new_rows[["id", "since"]]
+        if os.path.exists(dirty_path):
+            dirty = pd.concat([pd.read_csv(dirty_path, parse_dates=["since"]), dirty])
+        dirty.groupby("id", as_index=False)["since"].min().to_csv(dirty_path, index=False)
+
+    print(f"{new_rows['id'].nunique()} ids with new data, appended to {database_path}")
+else:
+    watermark = new_rows[["id", "last_datetime"]]
+    shutil.rmtree(dirty_dir, ignore_errors=True)
+
+    print(f"Dendrometer and environmental data transposed, joined and saved to {database_path}")
+
+watermark.to_csv(watermark_path, index=False)
@@ -4,9 +4,9 @@ import pandas as pd
 
 exec(open('src/constants/trend.py').read())
 exec(open('src/constants/palettes.py').read())
+exec(open('src/services/data-store.py').read())
 
-df = pd.read_csv("input/daily_data_with_trends.csv")
-df["date"] = pd.to_datetime(df["date"])
+df = load_table("daily_data_with_trends", columns=["id", "date", "trend", "normalized"])
 df = df.sort_values(["id", "date"])
 
 df["year"] = df["date"].dt.year
@@ -8,29 +8,33 @@ from scipy.interpolate import UnivariateSpline
 from datetime import datetime
 
 exec(open('src/constants/palettes.py').read())
+exec(open('src/services/data-store.py').read())
+exec(open('src/services/sensor-ids.py').read())
+exec(open('src/services/event-cache.py').read())
 
-df = pd.read_csv("input/daily_data_with_trends.csv")
-df_events = pd.read_csv("input/shrinking-events.csv")
-df["date"] = pd.to_datetime(df["date"])
-df = df.sort_values(["id", "date"])
+df_events = load_shrinking_events()
 
-df["year"] = df["date"].dt.year
-df["week"] = df["date"].dt.isocalendar().week
-df["month"] = df["date"].dt.month
-df["doy"] = df["date"].dt.dayofyear
-df["group"] = df["id"] + " " + df["year"].astype(str) + " " + df["week"].astype(str)
-df = df.dropna(subset=["D_mean"])
+# only the id and year lists are loaded up front, each callback loads the rows it plots
+ids = load_table("daily_data_with_trends", columns=["id"])["id"].unique()
+sensors = load_table("sensors")
+years = [int(y) for y in sorted(load_table("daily_data_with_trends", columns=["year"])["year"].unique())]
 
-first_val = df.groupby("id")["D_mean"].transform(lambda s: s.dropna().iloc[0] if s.notna().any() else float("nan"))
-df["D_base"] = df["D_mean"] - first_val
 
-first_val_year = df.groupby(["id", "year"])["D_mean"].transform(lambda s: s.dropna().iloc[0] if s.notna().any() else float("nan"))
-df["D_base_year"] = df["D_mean"] - first_val_year
+def load_id(selected_id, selected_year=None):
+    filters = id_filters(selected_id)
+    if selected_year is not None:
+        filters.append(("year", "==", selected_year))
+
+    df = load_daily_table(
+        "twd_data",
+        columns=["id", "date", "site", "id_code", "D_mean",
+                 "D_base", "GRO", "cum_neg_change", "D_base_year", "GRO_year", "cum_neg_change_year"],
+        filters=filters
+    )
+    df = attach_sensor_levels(df, sensors, ["individuum"])
+    df = df.sort_values(["id", "date"])
+    return df
 
-df["cum_pos_change"] = df.groupby("id")["D_base"].transform("cummax")
-df["cum_pos_change_year"] = df.groupby(["id", "year"])["D_base_year"].transform("cummax")
-df["cum_neg_change"] = df.groupby("id")["D_base"].transform("cummin")
-df["cum_neg_change_year"] = df.groupby(["id", "year"])["D_base_year"].transform("cummin")
 
 bgcolor = 'white'
 textcolor = palette2[1]
@@ -43,15 +47,15 @@ app = dash.Dash(__name__)
 app.layout = html.Div([
     dcc.Dropdown(
         id='id-dropdown',
-        options=[{'label': i, 'value': i} for i in df['id'].unique()],
-        value=df['id'].unique()[0], 
+        options=[{'label': i, 'value': i} for i in ids],
+        value=ids[0], 
         searchable=True,            
         placeholder="Select an ID",
     ),
     dcc.Dropdown(
         id='year-dropdown',
-        options=[{'label': 'All', 'value': 'All'}] + [{'label': i, 'value': i} for i in df['year'].unique()],
-        value=df['year'].unique()[0], 
+        options=[{'label': 'All', 'value': 'All'}] + [{'label': i, 'value': i} for i in years],
+        value=years[0], 
         searchable=True,            
         placeholder="Select an ID",
     ),
@@ -79,13 +83,13 @@ def update_figure(selected_id, selected_year, date_col="date", value_col="D_base
         sel_year = selected_year
 
     if sel_year is None or sel_year == "All":
-        dff = df[df['id'] == selected_id].copy()
+        dff = load_id(selected_id)
         neg_col = 'cum_neg_change'
-        pos_col = 'cum_pos_change'     
+        pos_col = 'GRO'     
     else:
-        dff = df[(df['id'] == selected_id) & (df['year'] == sel_year)].copy()
+        dff = load_id(selected_id, sel_year)
         neg_col = 'cum_neg_change_year'
-        pos_col = 'cum_pos_change_year'
+        pos_col = 'GRO_year'
         value_col = "D_base_year"   
 
     if dff.empty:
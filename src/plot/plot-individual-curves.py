@@ -8,6 +8,8 @@ from scipy.interpolate import UnivariateSpline
 from datetime import datetime
 
 exec(open('src/constants/palettes.py').read())
+exec(open('src/services/data-store.py').read())
+exec(open('src/services/sensor-ids.py').read())
 
 
 def plot_id_line(df, id_value, date_col="date", value_col="D_mean"):
@@ -34,9 +36,9 @@ def plot_id_line(df, id_value, date_col="date", value_col="D_mean"):
     )
     fig.show(renderer="browser")
 
-df = pd.read_csv("input/daily_data_with_trends.csv")
-df["date"] = pd.to_datetime(df["date"])
-df["year"] = df["date"].dt.year.astype(int)
+# only the id list is loaded up front, each callback loads the rows of one id
+ids = load_table("daily_data_with_trends", columns=["id"])["id"].unique()
+sensors = load_table("sensors")
 bgcolor = 'white'
 textcolor = palette1[1]
 shrinkingcolor = palette1[2]
@@ -50,8 +52,8 @@ app = dash.Dash(__name__)
 app.layout = html.Div([
     dcc.Dropdown(
         id='id-dropdown',
-        options=[{'label': i, 'value': i} for i in df['id'].unique()],
-        value=df['id'].unique()[0], 
+        options=[{'label': i, 'value': i} for i in ids],
+        value=ids[0], 
         searchable=True,            
         placeholder="Select an ID",
     ),
@@ -69,7 +71,12 @@ style={
     dash.Input('id-dropdown', 'value')
 )
 def update_figure(selected_id, date_col="date", value_col="D_mean"):
-    dff = df[df['id'] == selected_id]
+    dff = load_table(
+        "daily_data_with_trends",
+        columns=["id", "date", "year", "site", "id_code", "trend", value_col],
+        filters=id_filters(selected_id)
+    ).sort_values(date_col)
+    dff = attach_sensor_levels(dff, sensors, ["individuum"])
     shrinking_years = dff[dff["trend"] == "shrinking"]["year"].unique()
     growing_years = dff[dff["trend"] == "growth"]["year"].unique()
     fig = px.line(
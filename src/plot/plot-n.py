@@ -3,6 +3,7 @@ import pandas as pd
 import plotly.express as px
 
 exec(open('src/constants/palettes.py').read())
+exec(open('src/services/data-store.py').read())
 
 def plot_shrinking_vs_growth(df, group_col=None, palette_shrinking=palette1[2], palette_growth=palette1[4]):
     """
@@ -102,13 +103,9 @@ def plot_shrinking_vs_growth(df, group_col=None, palette_shrinking=palette1[2],
 
     return fig
 
-df = pd.read_csv("input/daily_data_with_trends.csv")
-df["date"] = pd.to_datetime(df["date"])
+df = load_table("daily_data_with_trends", columns=["id", "date", "year", "site", "D_mean", "trend"])
 df = df.dropna(subset=["D_mean"])
 
-split_cols = df["id"].str.split(".", expand=True)
-split_cols.columns = ["country", "site", "individuum", "branch", "section", "radius"]
-df = pd.concat([df[["date", "year", "D_mean", "id", "trend"]], split_cols[["site"]]], axis=1)
 df["position"] =  df["site"].str[-1]
 df["region"] =  df["site"].str[0]
 
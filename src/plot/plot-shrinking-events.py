@@ -5,8 +5,9 @@ import plotly.express as px
 
 
 exec(open('src/constants/palettes.py').read())
+exec(open('src/services/event-cache.py').read())
 
-df_events = pd.read_csv("input/shrinking-events.csv")
+df_events = load_shrinking_events()
 df_events_env = pd.read_csv("input/shrinking-events-env-long.csv")
 
 # correlation matrix
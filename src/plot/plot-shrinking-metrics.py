@@ -4,8 +4,9 @@ from scipy.stats import pearsonr
 import plotly.express as px
 
 exec(open('src/constants/palettes.py').read())
+exec(open('src/services/data-store.py').read())
 
-df = pd.read_csv("input/shrinking-metrics.csv")
+df = load_table("shrinking_metrics", columns=["shrinking_year", "growth_year", "n_shrinking_days", "first_shrinking_doy"])
 
 def groups_for(v):
     if pd.isna(v):
@@ -2,9 +2,9 @@ import pandas as pd
 from scipy.stats import linregress
 
 exec(open('src/constants/palettes.py').read())
+exec(open('src/services/data-store.py').read())
 
-df = pd.read_csv("input/daily_data.csv")
-df["date"] = pd.to_datetime(df["date"])
+df = load_table("daily_data", columns=["id", "date", "D_mean"])
 df = df.sort_values(["id", "date"])
 
 df["year"] = df["date"].dt.year
@@ -0,0 +1,36 @@
+import os
+import shutil
+import pandas as pd
+
+exec(open('src/services/data-store.py').read())
+exec(open('src/services/feature-spec.py').read())
+
+# Window lengths (days) and functions of the features
+windows = [3, 7, 14, 21, 30, 60, 90, 365, 1095]
+functions = window_functions  # sum, mean, max, min, time_min (days since the first minimum)
+
+
+# Environmental features of every id and day: sum, mean, max, min and time of
+# the minimum of AT, ST and SM over the n days before the day, as the event
+# features of shrinking-events-env.py. Computed and written one id at a time,
+# so only the days of one id are held in memory; every id is appended to the
+# site/year partitions as its own files.
+ids = sorted(load_table("daily_data_with_trends", columns=["id"])["id"].unique())
+
+path = store_path("rolling_features")
+if os.path.isdir(path):
+    shutil.rmtree(path)
+
+n_rows = 0
+for id_value in ids:
+    df = load_daily_table(columns=["id", "date", "D_mean", "AT_mean", "ST_mean", "SM_mean"], filters=id_filters(id_value))
+    df = df.dropna(subset=["D_mean"])
+    if df.empty:
+        continue
+
+    features = rolling_features(df, windows, functions)
+    print(f"{id_value}: {len(features)} days")
+    write_table(add_partition_columns(features), "rolling_features", append=True)
+    n_rows += len(features)
+
+print(f"\n{n_rows} days with {len(windows) * len(functions) * len(feature_envs)} features each in {path}")
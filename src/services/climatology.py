@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+
+exec(open('src/services/range-query.py').read())
+
+
+def build_climatology(df, columns, group_col="id", date_col="date"):
+    """
+    Build the day-of-year climatology of the given columns: for every id and
+    year the values by day of year (1 to 366) and their cumulative sums and
+    counts. The normal of any day-of-year window is then a few lookups per
+    year (see climatology_normal); the sparse tables of the range minima and
+    maxima are built on the first normal of 'min' or 'max' of a column.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Long-format dataframe with one row per id and date.
+    columns : list of str
+        Columns of the climatology (e.g. ['AT_mean', 'ST_mean', 'SM_mean']).
+    group_col, date_col : str
+        Names of the id and date columns.
+
+    Returns
+    -------
+    dict
+        'keys' (index of the ids), 'offsets' (the years of id k are the rows
+        offsets[k] to offsets[k + 1] - 1) and per column the structures under
+        'columns'.
+    """
+    df = df.sort_values([group_col, date_col])
+    groups = df[group_col].to_numpy()
+    years = df[date_col].dt.year.to_numpy()
+    doys = df[date_col].dt.dayofyear.to_numpy()
+
+    # one row per id and year
+    new_row = np.ones(len(groups), dtype=bool)
+    new_row[1:] = (groups[1:] != groups[:-1]) | (years[1:] != years[:-1])
+    rows = np.cumsum(new_row) - 1
+    row_groups = groups[new_row]
+    new_id = np.ones(len(row_groups), dtype=bool)
+    new_id[1:] = row_groups[1:] != row_groups[:-1]
+    offsets = np.concatenate([np.flatnonzero(new_id), [len(row_groups)]]).astype(np.int64)
+
+    climatology = {
+        "keys": pd.Index(row_groups[new_id]),
+        "offsets": offsets,
+        "columns": {},
+    }
+    for col in columns:
+        values = np.full((len(row_groups), 366), np.nan)
+        values[rows, doys - 1] = df[col].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        zeros = np.zeros((len(row_groups), 1))
+        climatology["columns"][col] = {
+            "sum": np.hstack([zeros, np.cumsum(np.where(valid, values, 0.0), axis=1)]),
+            "count": np.hstack([zeros, np.cumsum(valid, axis=1)]).astype(np.int64),
+            # the range tables run over all years one after the other; windows never cross a year
+            "values": values,
+        }
+    return climatology
+
+
+def climatology_normal(climatology, col, ids, anchors, n_days, function="sum"):
+    """
+    Normal of a statistic over the days of year of the windows
+    [anchor - n_days, anchor), as in the as_percentage branch of
+    shrinking-events-env.jl: the statistic over these days of year (wrapping
+    around the year end) in every year of the id with values, averaged over
+    the years.
+
+    Parameters
+    ----------
+    climatology : dict
+        Output of build_climatology.
+    col : str
+        Column of the statistic.
+    ids : np.ndarray
+        Id of every window.
+    anchors : np.ndarray
+        Anchor date of every window.
+    n_days : int
+        Window length in days.
+    function : str
+        'sum', 'mean', 'max' or 'min'.
+
+    Returns
+    -------
+    np.ndarray
+        Normal of every window (NaN for unknown ids, missing anchors or no
+        values in any year).
+    """
+    if function not in ("sum", "mean", "max", "min"):
+        raise ValueError(f"Invalid function {function}. Choose from sum, mean, max, min.")
+
+    structures = climatology["columns"][col]
+    anchors = pd.DatetimeIndex(np.asarray(anchors, dtype="datetime64[ns]"))
+    start_doy = (anchors - pd.Timedelta(days=n_days)).dayofyear.to_numpy()
+    end_doy = anchors.dayofyear.to_numpy()
+
+    # every window paired with every year of its id
+    series = climatology["keys"].get_indexer(ids)
+    known = (series >= 0) & ~np.isnan(end_doy)
+    first_row = np.where(known, climatology["offsets"][series], 0)
+    n_years = np.where(known, climatology["offsets"][series + 1] - first_row, 0)
+    window = np.repeat(np.arange(len(anchors)), n_years)
+    row = first_row[window] + np.arange(len(window)) - np.repeat(np.cumsum(n_years) - n_years, n_years)
+
+    # columns [a0, a1) and [b0, b1) of the days of year; the second part is
+    # the start of the year for windows that wrap around the year end
+    start = start_doy[window].astype(np.int64) - 1
+    end = end_doy[window].astype(np.int64) - 1
+    wraps = start >= end
+    a0, a1 = start, np.where(wraps, 366, end)
+    b0, b1 = np.zeros_like(start), np.where(wraps, end, 0)
+
+    def part_total(table):
+        return table[row, a1] - table[row, a0] + table[row, b1] - table[row, b0]
+
+    count = part_total(structures["count"])
+    if function in ("sum", "mean"):
+        total = part_total(structures["sum"])
+        year_stat = total if function == "sum" else total / np.maximum(count, 1)
+    else:
+        op = np.minimum if function == "min" else np.maximum
+        table = cached_sparse_table(structures, op)
+        flat = row * 366
+        year_stat = range_query(table, flat + a0, flat + a1 - 1, op=op)
+        has_b = b1 > b0
+        year_stat[has_b] = op(year_stat[has_b], range_query(table, flat[has_b] + b0[has_b], flat[has_b] + b1[has_b] - 1, op=op))
+
+    # average over the years with values
+    has_values = count > 0
+    n_valid = np.bincount(window[has_values], minlength=len(anchors))
+    stat_total = np.bincount(window[has_values], weights=year_stat[has_values], minlength=len(anchors))
+    normal = np.full(len(anchors), np.nan)
+    np.divide(stat_total, n_valid, out=normal, where=n_valid > 0)
+    return normal
+
+
+def percentage_of_normal(values, normal):
+    """Values in % of their normal (NaN where the normal is 0 or missing)."""
+    values = np.asarray(values, dtype=float)
+    normal = np.asarray(normal, dtype=float)
+    result = np.full(len(values), np.nan)
+    valid = ~np.isnan(normal) & (normal != 0)
+    result[valid] = values[valid] / normal[valid] * 100
+    return result
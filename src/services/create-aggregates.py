@@ -0,0 +1,157 @@
+import os
+
+exec(open('src/services/data-store.py').read())
+exec(open('src/services/database.py').read())
+
+# resolution name -> DuckDB date_trunc unit; every resolution is stored in its own table (e.g. aggregates_daily)
+resolutions = {
+    "hourly": "hour",
+    "daily": "day",
+    "weekly": "week",
+    "monthly": "month",
+    "yearly": "year",
+}
+variables = ["D", "AT", "ST", "SM"]
+
+
+def create_aggregates_query(table="measurements", date_col="datetime", dirty_table=None, sensors_table="sensors"):
+    """
+    Build the query that aggregates the measurements to all resolutions in a
+    single scan (GROUPING SETS). Periods are identified by their start
+    ('period'); weeks are ISO weeks starting on Monday. Grouping and the
+    running maxima only use the integer 'id_code'; the id and site labels are
+    joined from the sensor table to the aggregates at the end.
+
+    Parameters
+    ----------
+    table : str
+        Table of the DuckDB database with datetime, id_code, and numeric values (default: 'measurements').
+    date_col : str
+        Name of the datetime column (default: 'datetime').
+    dirty_table : str or None
+        Table with 'id_code' and 'since' columns from an incremental ingest.
+        If given, only the listed sensors are aggregated, starting at the first
+        period of any resolution that contains 'since'.
+    sensors_table : str
+        Table or view with the 'id_code', 'id' and 'site' of every sensor (default: 'sensors').
+
+    Returns
+    -------
+    str
+        Query returning 'resolution', 'period', 'id_code', 'id', 'site',
+        '<var>_mean', '<var>_min', '<var>_max', '<var>_n' (number of valid samples)
+        and the stem cycle metrics of D:
+        'D_max_time' / 'D_min_time' (first timestamp of the maximum / minimum),
+        'D_amplitude' (D_max - D_min) and
+        'D_mds' (maximum daily shrinkage: largest drop below the running daily
+        maximum within one day; for coarser resolutions the largest of the period).
+    """
+    dirty_join = ""
+    if dirty_table is not None:
+        dirty_join = f"""
+        JOIN {dirty_table} dirty
+            ON i.id_code = dirty.id_code
+            AND i.{date_col} >= LEAST(date_trunc('year', dirty.since), date_trunc('week', dirty.since))
+        """
+
+    period_cols = ",\n".join(
+        f"date_trunc('{unit}', i.{date_col}) AS {name}" for name, unit in resolutions.items()
+    )
+    stat_cols = ",\n".join(
+        f'AVG("{var}") AS {var}_mean, MIN("{var}") AS {var}_min, '
+        f'MAX("{var}") AS {var}_max, COUNT("{var}") AS {var}_n'
+        for var in variables
+    )
+    cycle_cols = """
+        arg_max(datetime, ("D", -epoch_us(datetime))) FILTER (WHERE "D" IS NOT NULL) AS D_max_time,
+        arg_min(datetime, ("D", datetime)) FILTER (WHERE "D" IS NOT NULL) AS D_min_time,
+        MAX("D") - MIN("D") AS D_amplitude,
+        MAX(D_drawdown) AS D_mds
+    """
+    resolution_case = "\n".join(
+        f"WHEN GROUPING({name}) = 0 THEN '{name}'" for name in resolutions
+    )
+    grouping_sets = ", ".join(f"(id_code, {name})" for name in resolutions)
+
+    return f"""
+    WITH m AS (
+        SELECT i.id_code, i.{date_col} AS datetime,
+               {period_cols},
+               i."D", i."AT", i."ST", i."SM",
+               MAX(i."D") OVER (
+                   PARTITION BY i.id_code, date_trunc('day', i.{date_col})
+                   ORDER BY i.{date_col}
+                   ROWS UNBOUNDED PRECEDING
+               ) - i."D" AS D_drawdown
+        FROM {table} i
+        {dirty_join}
+    ),
+    a AS (
+        SELECT CASE {resolution_case} END AS resolution,
+               COALESCE({", ".join(resolutions)}) AS period,
+               id_code,
+               {stat_cols},
+               {cycle_cols}
+        FROM m
+        GROUP BY GROUPING SETS ({grouping_sets})
+    )
+    SELECT a.resolution, a.period, a.id_code, s.id, s.site,
+           a.* EXCLUDE (resolution, period, id_code)
+    FROM a
+    JOIN {sensors_table} s USING (id_code)
+    """
+
+
+dirty_path = "input/dirty/aggregates.csv"
+
+con = connect_database()
+# labels of the sensor codes, written at ingest
+con.register("sensors", load_table("sensors", columns=["id_code", "id", "site"]))
+tables = set(con.execute("SELECT table_name FROM duckdb_tables()").df()["table_name"])
+incremental = os.path.exists(dirty_path) and all(f"aggregates_{name}" in tables for name in resolutions)
+
+if incremental:
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE dirty AS
+        SELECT s.id_code, d.since
+        FROM read_csv('{dirty_path}', header=true, columns={{'id': 'VARCHAR', 'since': 'TIMESTAMP'}}) d
+        JOIN sensors s USING (id)
+    """)
+    con.execute(f"CREATE OR REPLACE TEMP TABLE new_aggregates AS {create_aggregates_query(dirty_table='dirty')}")
+
+    # replace every period from the one containing 'since' onwards
+    for name, unit in resolutions.items():
+        con.execute(f"""
+            DELETE FROM aggregates_{name} a
+            USING dirty
+            WHERE a.id_code = dirty.id_code AND a.period >= date_trunc('{unit}', dirty.since)
+        """)
+        con.execute(f"""
+            INSERT INTO aggregates_{name}
+            SELECT n.* EXCLUDE (resolution)
+            FROM new_aggregates n
+            JOIN dirty ON n.id_code = dirty.id_code
+            WHERE n.resolution = '{name}' AND n.period >= date_trunc('{unit}', dirty.since)
+            ORDER BY n.id_code, n.period
+        """)
+    print(f"Aggregates updated for {con.execute('SELECT COUNT(*) FROM dirty').fetchone()[0]} ids")
+else:
+    con.execute(f"CREATE OR REPLACE TEMP TABLE new_aggregates AS {create_aggregates_query()}")
+
+    for name in resolutions:
+        con.execute(f"""
+            CREATE OR REPLACE TABLE aggregates_{name} AS
+            SELECT * EXCLUDE (resolution)
+            FROM new_aggregates
+            WHERE resolution = '{name}'
+            ORDER BY id_code, period
+        """)
+
+for name in resolutions:
+    n_rows = con.execute(f"SELECT COUNT(*) FROM aggregates_{name}").fetchone()[0]
+    print(f"{n_rows} rows in aggregates_{name}")
+
+con.close()
+
+if incremental:
+    os.remove(dirty_path)
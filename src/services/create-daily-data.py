@@ -1,44 +1,82 @@
+import os
 import duckdb
 import pandas as pd
 
-def create_daily_data_duckdb(file_path, date_col="datetime"):
+exec(open('src/services/data-store.py').read())
+exec(open('src/services/sensor-ids.py').read())
+exec(open('src/services/database.py').read())
+
+def create_daily_data_duckdb(table="aggregates_daily", dirty=None):
     """
-    Create a daily averaged dataframe from a CSV/Parquet using DuckDB.
+    Load the daily aggregates (see create-aggregates.py) from the DuckDB database.
     
     Parameters
     ----------
-    file_path : str
-        Path to the CSV or Parquet file with datetime, id, and numeric values.
-    date_col : str
-        Name of the datetime column (default: 'datetime').
-    value_col : str
-        Name of the numeric value column to average (default: 'D').
+    table : str
+        Table of the DuckDB database with the daily aggregates (default: 'aggregates_daily').
+    dirty : pd.DataFrame or None
+        'id_code' and 'since' of the sensors with new data from an incremental
+        ingest. If given, only days on or after 'since' of these sensors are loaded.
     
     Returns
     -------
     pd.DataFrame
-        A daily averaged dataframe grouped by date and id.
+        A daily dataframe grouped by date and id with mean, min, max and
+        number of valid samples of every variable.
+    """
+    con = connect_database(read_only=True)
+
+    dirty_join = ""
+    if dirty is not None:
+        con.register("dirty", dirty[["id_code", "since"]])
+        dirty_join = """
+    JOIN dirty ON a.id_code = dirty.id_code AND a.period >= date_trunc('day', dirty.since)
     """
-    con = duckdb.connect()
 
     query = f"""
-    SELECT CAST({date_col} AS DATE) AS date,
-           id,
-           AVG("D") AS D_mean,
-           AVG("AT") AS AT_mean,
-           AVG("ST") AS ST_mean,
-           AVG("SM") AS SM_mean
-    FROM read_csv_auto('{file_path}', SAMPLE_SIZE=-1)
-    GROUP BY date, id
-    ORDER BY date, id
+    SELECT CAST(a.period AS DATE) AS date,
+           a.id,
+           a.site,
+           a.* EXCLUDE (period, id, site, id_code)
+    FROM {table} a
+    {dirty_join}
+    ORDER BY date, a.id
     """
 
-    return con.execute(query).df()
+    df_daily = con.execute(query).df()
+    con.close()
+
+    return df_daily
+
+sensors = load_table("sensors")
+
+dirty_path = "input/dirty/daily_data.csv"
+incremental = os.path.exists(dirty_path) and os.path.isdir(store_path("daily_data"))
+
+dirty = None
+if incremental:
+    dirty = pd.read_csv(dirty_path, parse_dates=["since"]).merge(sensors[["id", "id_code"]], on="id")
+
+df_daily = create_daily_data_duckdb(dirty=dirty)
+
+# integer codes and names of the id hierarchy from the sensor table written at ingest
+df_daily = encode_sensor_ids(df_daily, sensors)
+df_daily = attach_sensor_levels(df_daily, sensors, [level for level in id_levels if level != "site"])
+df_daily["date"] = pd.to_datetime(df_daily["date"])
+df_daily = add_partition_columns(df_daily)
 
-df_daily = create_daily_data_duckdb("input/input.csv")
+if incremental:
+    # rewrite only the site/year partitions touched by the last ingest
+    df_old = load_table("daily_data", filters=[
+        ("site", "in", df_daily["site"].unique().tolist()),
+        ("year", "in", df_daily["year"].unique().tolist()),
+    ])
+    since = df_old["id"].astype(str).map(dirty.set_index("id")["since"].dt.normalize())
+    df_old = df_old[~(df_old["date"] >= since)]
+    df_daily = pd.concat([df_old, df_daily], ignore_index=True).sort_values(["date", "id"])
+    print(f"Daily data updated for {len(dirty)} ids")
 
-split_cols = df_daily["id"].str.split(".", expand=True)
-split_cols.columns = ["country", "site", "individuum", "branch", "section", "radius"]
-df_daily = pd.concat([df_daily[["date", "D_mean", "AT_mean", "ST_mean", "SM_mean", "id"]], split_cols], axis=1)
+write_table(df_daily, "daily_data", replace_partitions=incremental)
 
-df_daily.to_csv("input/daily_data.csv", index=False)
+if incremental:
+    os.remove(dirty_path)
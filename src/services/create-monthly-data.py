@@ -1,46 +1,61 @@
+import os
 import duckdb
 import pandas as pd
 
+exec(open('src/services/data-store.py').read())
+exec(open('src/services/sensor-ids.py').read())
+exec(open('src/services/database.py').read())
 
-def create_monthly_data_duckdb(file_path, date_col="datetime"):
+
+def create_monthly_data_duckdb(table="aggregates_monthly", dirty=None):
     """
-    Create a monthly averaged dataframe from a CSV/Parquet using DuckDB,
+    Load the monthly aggregates (see create-aggregates.py) from the DuckDB database,
     and pivot so that months appear as columns (e.g. 'Jan_AT').
     Adds a 'year' column to specify the year for each row.
     
     Parameters
     ----------
-    file_path : str
-        Path to the CSV or Parquet file with datetime, id, and numeric values.
-    date_col : str
-        Name of the datetime column (default: 'datetime').
+    table : str
+        Table of the DuckDB database with the monthly aggregates (default: 'aggregates_monthly').
+    dirty : pd.DataFrame or None
+        'id_code' and 'since' of the sensors with new data from an incremental
+        ingest. If given, only years from 'since' onwards of these sensors are loaded.
     
     Returns
     -------
     pd.DataFrame
         A monthly averaged dataframe (wide format) with months as columns and year column.
     """
-    con = duckdb.connect()
+    con = connect_database(read_only=True)
+
+    dirty_join = ""
+    if dirty is not None:
+        con.register("dirty", dirty[["id_code", "since"]])
+        dirty_join = """
+    JOIN dirty ON a.id_code = dirty.id_code AND a.period >= date_trunc('year', dirty.since)
+    """
     
     query = f"""
     SELECT 
-        YEAR({date_col}) AS year,
-        MONTH({date_col}) AS month_num,
-        id,
-        AVG("AT") AS AT_mean,
-        AVG("ST") AS ST_mean,
-        AVG("SM") AS SM_mean
-    FROM read_csv_auto('{file_path}', SAMPLE_SIZE=-1)
-    GROUP BY year, month_num, id
-    ORDER BY id, year, month_num
+        YEAR(a.period) AS year,
+        MONTH(a.period) AS month_num,
+        a.id,
+        a.site,
+        a.AT_mean,
+        a.ST_mean,
+        a.SM_mean
+    FROM {table} a
+    {dirty_join}
+    ORDER BY a.id, year, month_num
     """
     
     df_monthly = con.execute(query).df()
+    con.close()
     
     df_monthly["month_name"] = pd.to_datetime(df_monthly["month_num"], format='%m').dt.strftime('%b')
     
     df_pivot = df_monthly.pivot(
-        index=["id", "year"],
+        index=["id", "site", "year"],
         columns="month_name",
         values=["AT_mean", "ST_mean", "SM_mean"]
     )
@@ -58,11 +73,33 @@ def create_monthly_data_duckdb(file_path, date_col="datetime"):
     
     return df_pivot
 
-df_monthly = create_monthly_data_duckdb("input/input.csv")
+sensors = load_table("sensors")
+
+dirty_path = "input/dirty/monthly_data.csv"
+incremental = os.path.exists(dirty_path) and os.path.isdir(store_path("monthly_data"))
+
+dirty = None
+if incremental:
+    dirty = pd.read_csv(dirty_path, parse_dates=["since"]).merge(sensors[["id", "id_code"]], on="id")
+
+df_monthly = create_monthly_data_duckdb(dirty=dirty)
+
+# integer codes and names of the id hierarchy from the sensor table written at ingest
+df_monthly = encode_sensor_ids(df_monthly, sensors)
+df_monthly = attach_sensor_levels(df_monthly, sensors, [level for level in id_levels if level != "site"])
 
-split_cols = df_monthly["id"].str.split(".", expand=True)
-split_cols.columns = ["country", "site", "individuum", "branch", "section", "radius"]
-df_monthly = pd.concat([df_monthly, split_cols], axis=1)
+if incremental:
+    # rewrite only the site/year partitions touched by the last ingest
+    df_old = load_table("monthly_data", filters=[
+        ("site", "in", df_monthly["site"].unique().tolist()),
+        ("year", "in", df_monthly["year"].unique().tolist()),
+    ])
+    since_year = df_old["id"].astype(str).map(dirty.set_index("id")["since"].dt.year)
+    df_old = df_old[~(df_old["year"] >= since_year)]
+    df_monthly = pd.concat([df_old, df_monthly], ignore_index=True).sort_values(["id", "year"])
+    print(f"Monthly data updated for {len(dirty)} ids")
 
-df_monthly.to_csv("input/monthly_data.csv", index=False)
+write_table(df_monthly, "monthly_data", replace_partitions=incremental)
 
+if incremental:
+    os.remove(dirty_path)
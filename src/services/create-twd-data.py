@@ -0,0 +1,51 @@
+import pandas as pd
+
+exec(open('src/services/data-store.py').read())
+
+
+def decompose_growth(df, value_col="D_mean", by=("id",), suffix=""):
+    """
+    Split the stem diameter series of every group into irreversible growth
+    (GRO) and tree water deficit (TWD) following the zero-growth concept:
+    the stem only grows while it exceeds its previous maximum, every drop
+    below that maximum is water deficit.
+
+    All groups are processed at once with grouped cumulative operations.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataframe sorted by the group columns and date, without missing values in value_col.
+    value_col : str
+        Name of the stem diameter column (default: 'D_mean').
+    by : sequence of str
+        Columns identifying one series (default: id; ['id', 'year'] for yearly series).
+    suffix : str
+        Suffix of the new columns (e.g. '_year').
+
+    Returns
+    -------
+    pd.DataFrame
+        df with the added columns 'D_base' (diameter relative to the first value),
+        'GRO' (running maximum of D_base), 'TWD' (GRO - D_base) and
+        'cum_neg_change' (running minimum of D_base).
+    """
+    keys = [df[col] for col in by]
+    base = df[value_col] - df.groupby(keys, observed=True, sort=False)[value_col].transform("first")
+    base_groups = base.groupby(keys, observed=True, sort=False)
+
+    df[f"D_base{suffix}"] = base
+    df[f"GRO{suffix}"] = base_groups.cummax()
+    df[f"TWD{suffix}"] = df[f"GRO{suffix}"] - base
+    df[f"cum_neg_change{suffix}"] = base_groups.cummin()
+    return df
+
+
+df = load_daily_table("daily_data", columns=["id", "id_code", "site", "date", "D_mean"])
+df = df.dropna(subset=["D_mean"])
+df = df.sort_values(["id", "date"], ignore_index=True)
+
+df = decompose_growth(df)
+df = decompose_growth(df, by=("id", "year"), suffix="_year")
+
+write_table(df.drop(columns=["week", "month", "doy"]), "twd_data")
@@ -0,0 +1,166 @@
+import os
+import uuid
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+store_dir = "input/store"
+
+# canonical dtypes of the daily tables (daily_data, daily_data_with_trends, ...)
+daily_dtypes = {
+    "D_mean": "float32",
+    "AT_mean": "float32",
+    "ST_mean": "float32",
+    "SM_mean": "float32",
+    **{f"{var}_{stat}": "float32" for var in ["D", "AT", "ST", "SM"] for stat in ["min", "max"]},
+    **{f"{var}_n": "int16" for var in ["D", "AT", "ST", "SM"]},
+    "D_amplitude": "float32",
+    "D_mds": "float32",
+    "normalized": "float32",
+    "year": "int16",
+    "week": "int8",
+    "month": "int8",
+    "doy": "int16",
+    "id": "category",
+    "site": "category",
+    "trend": "category",
+}
+
+
+def store_path(name):
+    """
+    Return the directory of a table in the data store (e.g. 'input/store/daily_data').
+    """
+    return os.path.join(store_dir, name)
+
+
+def add_partition_columns(df, date_col="date"):
+    """
+    Add the 'site' and 'year' partition columns if they are missing.
+    'site' is parsed from the id (country.site.individuum.branch.section.radius),
+    'year' from the date column.
+    """
+    if "site" not in df.columns:
+        df["site"] = df["id"].str.split(".").str[1]
+    if "year" not in df.columns:
+        df["year"] = pd.to_datetime(df[date_col]).dt.year
+    return df
+
+
+def write_table(df, name, partition_cols=("site", "year"), replace_partitions=False, append=False):
+    """
+    Write a dataframe to the data store as a hive-partitioned Parquet dataset
+    (input/store/<name>/site=.../year=.../).
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Table to write. Must contain the partition columns.
+    name : str
+        Name of the table in the store.
+    partition_cols : sequence of str
+        Columns to partition by (default: site and year). Empty for small
+        tables that are stored in a single file (e.g. the sensor table).
+    replace_partitions : bool
+        If False (default) the whole table is replaced. If True only the
+        partitions present in df are replaced and all others are kept.
+    append : bool
+        If True the rows are added to the table as new files and nothing is
+        removed (e.g. for a table written in chunks that share partitions).
+    """
+    path = store_path(name)
+    if not (replace_partitions or append) and os.path.isdir(path):
+        shutil.rmtree(path)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if table.num_rows == 0 and not (replace_partitions or append):
+        # pyarrow writes no files for an empty table; keep the schema in one empty file
+        os.makedirs(path, exist_ok=True)
+        pq.write_table(table, os.path.join(path, "part-0.parquet"))
+        print(f"0 rows written to {path}")
+        return
+
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=list(partition_cols) or None,
+        partitioning_flavor="hive",
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet" if append else None,
+        existing_data_behavior="overwrite_or_ignore" if append else "delete_matching",
+    )
+    print(f"{len(df)} rows written to {path}")
+
+
+def load_table(name, columns=None, filters=None):
+    """
+    Load a table from the data store. Only the requested columns are read and
+    the filters are pushed down to the Parquet scan, so partitions (site, year)
+    and row groups that cannot match are skipped.
+
+    Parameters
+    ----------
+    name : str
+        Name of the table in the store.
+    columns : list of str or None
+        Columns to load (default: all).
+    filters : list of tuples or None
+        Predicates in pyarrow notation, combined with AND,
+        e.g. [("site", "==", "E1088D"), ("year", "in", [2017, 2018])].
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    dataset = ds.dataset(
+        store_path(name),
+        format="parquet",
+        partitioning=ds.HivePartitioning.discover(infer_dictionary=False),
+    )
+    expression = pq.filters_to_expression(filters) if filters else None
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def id_filters(id_value):
+    """
+    Filters that select a single id and prune all partitions of other sites.
+    """
+    return [("site", "==", id_value.split(".")[1]), ("id", "==", id_value)]
+
+
+def apply_daily_schema(df, date_col="date"):
+    """
+    Add the calendar fields (year, ISO week, month, day of year) and cast the
+    columns of a daily table to daily_dtypes.
+    """
+    dates = df[date_col]
+    df["year"] = dates.dt.year
+    df["week"] = dates.dt.isocalendar().week
+    df["month"] = dates.dt.month
+    df["doy"] = dates.dt.dayofyear
+    return df.astype({col: dtype for col, dtype in daily_dtypes.items() if col in df.columns})
+
+
+def load_daily_table(name="daily_data_with_trends", columns=None, filters=None):
+    """
+    Load a daily table from the data store with the compact schema of
+    apply_daily_schema. Group by the categorical 'id' with observed=True.
+
+    Parameters
+    ----------
+    name : str
+        Name of the table in the store (default: 'daily_data_with_trends').
+    columns : list of str or None
+        Columns to load (default: all). 'date' is always loaded.
+    filters : list of tuples or None
+        Predicates in pyarrow notation, see load_table.
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    if columns is not None and "date" not in columns:
+        columns = ["date"] + list(columns)
+    return apply_daily_schema(load_table(name, columns=columns, filters=filters))
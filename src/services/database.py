@@ -0,0 +1,56 @@
+import os
+import duckdb
+
+# persistent DuckDB database holding the typed long-format measurements
+database_path = "input/dendrometer.duckdb"
+
+# DuckDB spills to temp_dir once memory_limit is reached
+threads = os.cpu_count()
+memory_limit = "4GB"
+temp_dir = "input/.duckdb_tmp"
+
+
+def connect_database(read_only=False, threads=threads, memory_limit=memory_limit):
+    """
+    Open the persistent DuckDB database with the thread and memory limits applied.
+
+    Parameters
+    ----------
+    read_only : bool
+        Open the database read-only (default: False). Several read-only
+        connections from different processes can be open at the same time.
+    threads : int
+        Number of threads DuckDB may use (default: all cores).
+    memory_limit : str
+        Memory DuckDB may use before spilling to temp_dir (default: '4GB').
+
+    Returns
+    -------
+    duckdb.DuckDBPyConnection
+    """
+    con = duckdb.connect(database_path, read_only=read_only)
+    con.execute(f"SET threads = {threads}")
+    con.execute(f"SET memory_limit = '{memory_limit}'")
+    con.execute(f"SET temp_directory = '{temp_dir}'")
+    con.execute("SET preserve_insertion_order = false")
+    return con
+
+
+def create_measurements_table(con):
+    """
+    (Re)create the empty 'measurements' table: one row per sensor and
+    timestamp with the dendrometer reading and the environmental data of its
+    site. Sensors are stored by their integer 'id_code' only; the id and its
+    levels (site, ...) are in the sensor table (see sensor-ids.py).
+    """
+    con.execute("""
+        CREATE OR REPLACE TABLE measurements (
+            datetime TIMESTAMP NOT NULL,
+            id_code SMALLINT NOT NULL,
+            year SMALLINT NOT NULL,
+            "D" DOUBLE,
+            "AT" DOUBLE,
+            "ST" DOUBLE,
+            "SM" DOUBLE
+        )
+    """)
@@ -0,0 +1,203 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+exec(open('src/services/data-store.py').read())
+exec(open('src/services/shrinking-detector.py').read())
+exec(open('src/services/parallel-detection.py').read())
+
+# cached events of every (detector, parameters, series) combination, one file each
+event_cache_dir = "input/cache/events"
+
+# bump when a detector changes its results, so all cached events are recomputed
+event_cache_version = 1
+
+# most entries kept in the cache; the least recently used entries beyond it are deleted
+event_cache_max_entries = 1000
+
+
+def event_cache_key(detector_name, params, dates, values, series_args=()):
+    """
+    Content hash of one detector run on one series: the detector name and
+    parameters and the dates, values and per-series arguments (e.g. the
+    amplitude) of the series.
+
+    Returns
+    -------
+    str
+        Hex digest, used as the file name of the cached events.
+    """
+    spec = json.dumps(
+        {"version": event_cache_version, "detector": detector_name, "params": params,
+         "series_args": [float(arg) for arg in series_args]},
+        sort_keys=True, default=str
+    )
+    digest = hashlib.sha256(spec.encode())
+    digest.update(np.asarray(dates, dtype="datetime64[ns]").view(np.int64).tobytes())
+    digest.update(np.asarray(values, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def event_cache_path(key):
+    return os.path.join(event_cache_dir, f"{key}.parquet")
+
+
+def prune_event_cache(keep=(), max_entries=None):
+    """
+    Delete the least recently used entries of the event cache (by the
+    modification time of their files, which every use refreshes) until at
+    most max_entries are left. Entries in keep are never deleted.
+
+    Returns
+    -------
+    int
+        Number of deleted entries.
+    """
+    max_entries = event_cache_max_entries if max_entries is None else max_entries
+    if not os.path.isdir(event_cache_dir):
+        return 0
+    keep = {event_cache_path(key) for key in keep}
+    paths = [entry.path for entry in os.scandir(event_cache_dir) if entry.name.endswith(".parquet")]
+    if len(paths) <= max_entries:
+        return 0
+
+    paths.sort(key=os.path.getmtime)
+    deleted = 0
+    for path in paths:
+        if len(paths) - deleted <= max_entries:
+            break
+        if path not in keep:
+            os.remove(path)
+            deleted += 1
+    return deleted
+
+
+def detect_events_cached(detector_name, detector, dates, values, offsets, series_args=(), n_workers=None, **params):
+    """
+    Run an event detector on packed series (see detect_events_parallel), but
+    only on the series whose events are not cached yet: series whose data,
+    amplitude or detector parameters did not change since an earlier run get
+    their events from the cache.
+
+    The cache holds at most event_cache_max_entries entries (one per series,
+    detector and parameters). Every use of an entry refreshes it, and after
+    each call the least recently used entries beyond the limit are deleted
+    (except those of this call), so entries of old data or parameters expire.
+
+    Parameters
+    ----------
+    detector_name : str
+        Name of the detector, part of the cache key (e.g. 'nested').
+    detector : callable
+        Detector as in detect_events_parallel (e.g. detect_nested_events_batch).
+    dates, values : np.ndarray
+        Packed dates and values.
+    offsets : np.ndarray
+        Start offsets of the series.
+    series_args : tuple of np.ndarray
+        Arguments with one entry per series (e.g. amplitudes).
+    n_workers : int or None
+        Number of worker processes for the series that are detected.
+    **params
+        Further keyword arguments of the detector.
+
+    Returns
+    -------
+    pd.DataFrame
+        The events of all series in series order, with a 'series' column, as
+        returned by the detector.
+    """
+    dates = np.asarray(dates)
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    series_args = tuple(np.asarray(arg) for arg in series_args)
+    n_series = len(offsets) - 1
+
+    keys = [
+        event_cache_key(
+            detector_name, params,
+            dates[offsets[k]:offsets[k + 1]], values[offsets[k]:offsets[k + 1]],
+            [arg[k] for arg in series_args]
+        )
+        for k in range(n_series)
+    ]
+    missing = np.array([k for k in range(n_series) if not os.path.exists(event_cache_path(keys[k]))], dtype=np.int64)
+    print(f"Events of {n_series - len(missing)} series cached, detecting {len(missing)} series")
+
+    # detect the missing series, packed one after the other
+    if len(missing) > 0 or n_series == 0:
+        lengths = offsets[missing + 1] - offsets[missing]
+        positions = np.concatenate([np.arange(offsets[k], offsets[k + 1]) for k in missing]) if len(missing) else np.zeros(0, dtype=np.int64)
+        detected = detect_events_parallel(
+            detector, dates[positions], values[positions],
+            np.concatenate([[0], np.cumsum(lengths)]),
+            series_args=tuple(arg[missing] for arg in series_args),
+            n_workers=n_workers,
+            **params
+        )
+        if n_series == 0:
+            return detected
+
+        os.makedirs(event_cache_dir, exist_ok=True)
+        by_series = {position: events for position, events in detected.groupby("series", sort=False)}
+        for position, k in enumerate(missing):
+            events = by_series.get(position, detected.iloc[:0]).drop(columns="series")
+            path = event_cache_path(keys[k])
+            events.to_parquet(f"{path}.tmp", index=False)
+            os.replace(f"{path}.tmp", path)
+
+    frames = []
+    for k in range(n_series):
+        path = event_cache_path(keys[k])
+        events = pd.read_parquet(path)
+        os.utime(path)  # mark as recently used
+        events.insert(0, "series", np.full(len(events), k, dtype=np.int64))
+        frames.append(events)
+    prune_event_cache(keep=keys)
+    # series without events only matter if no series has any
+    return pd.concat([events for events in frames if len(events) > 0] or frames[:1], ignore_index=True)
+
+
+def load_shrinking_events(min_shrink_pct=10.0, recovery_pct=95.0, nested_min_shrink_pct=15.0,
+                          nested_recovery_pct=80.0, max_nesting_depth=10, max_duration=60,
+                          min_duration=2, rebound_tolerance=15, n_workers=None):
+    """
+    Nested shrinking events of all ids (see detect_nested_events) from the
+    current daily data, in the format of input/shrinking-events.csv. Only ids
+    whose data changed since the last call are detected again.
+
+    Parameters
+    ----------
+    Parameters of detect_nested_events (defaults as in shrinking-events.jl)
+    and the number of worker processes.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per event, sorted by id, start and depth.
+    """
+    df = load_table("daily_data_with_trends", columns=["id", "date", "D_mean"])
+    df = df.dropna(subset=["D_mean"])
+    df = df.sort_values(["id", "date"], ignore_index=True)
+
+    ids, dates, values, offsets = pack_series(df)
+    amps = np.array([np.ptp(values[lo:hi]) for lo, hi in zip(offsets[:-1], offsets[1:])])
+
+    events = detect_events_cached(
+        "nested", detect_nested_events_batch, dates, values, offsets,
+        series_args=(amps,),
+        n_workers=n_workers,
+        min_shrink_pct=min_shrink_pct,
+        recovery_pct=recovery_pct,
+        nested_min_shrink_pct=nested_min_shrink_pct,
+        nested_recovery_pct=nested_recovery_pct,
+        max_nesting_depth=max_nesting_depth,
+        max_duration=max_duration,
+        min_duration=min_duration,
+        rebound_tolerance=rebound_tolerance
+    )
+
+    events.insert(0, "id", ids[events.pop("series").to_numpy()])
+    return events.sort_values(["id", "start", "depth"], ignore_index=True)
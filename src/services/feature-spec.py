@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+
+exec(open('src/services/window-aggregator.py').read())
+exec(open('src/services/climatology.py').read())
+
+# environmental variables and their short names in the feature names
+feature_envs = {"AT_mean": "AT", "ST_mean": "ST", "SM_mean": "SM"}
+
+
+def feature_grid(configurations, envs=feature_envs):
+    """
+    Expand a declaration of window features into one row per feature, in
+    the order of shrinking-events-env.jl (configuration, function, variable,
+    timepoint, percentage flag). Features declared more than once are kept
+    once.
+
+    Parameters
+    ----------
+    configurations : list of tuple
+        (n, functions, timepoints, pct_options): window length in days,
+        functions (see window_functions), anchors of the windows (e.g.
+        'start', 'stop', 'recovery') and whether the features are absolute
+        (False) and/or percentages of normal (True).
+    envs : dict
+        Column -> short name of the environmental variables.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns 'env' (short name), 'col', 'n', 'func', 'timepoint', 'pct'
+        and 'name' (column name in the wide table, e.g. 'sum_AT_7_start').
+    """
+    rows = [
+        (env, col, n, func, timepoint, pct)
+        for n, functions, timepoints, pct_options in configurations
+        for func in functions
+        for col, env in envs.items()
+        for timepoint in timepoints
+        for pct in pct_options
+    ]
+    features = pd.DataFrame(rows, columns=["env", "col", "n", "func", "timepoint", "pct"])
+    features = features.drop_duplicates(ignore_index=True)
+    features["name"] = (
+        features["func"] + "_" + features["env"] + "_" + features["n"].astype(str) + "_" + features["timepoint"]
+        + np.where(features["pct"], "_pct", "")
+    )
+    return features
+
+
+def compute_features(index, features, ids, anchors, climatology=None):
+    """
+    Evaluate the features of a grid for every event. The windows of every
+    timepoint and length are resolved once for all variables, and all
+    functions of a variable come from one call of window_statistics.
+    Percentages of normal (pct) relate the value of the window to the normal
+    of its days of year (see climatology_normal); as in
+    shrinking-events-env.jl they are missing for windows without values, and
+    'time_min' is not relative.
+
+    Parameters
+    ----------
+    index : dict
+        Output of build_window_index with the columns of the features.
+    features : pd.DataFrame
+        Output of feature_grid.
+    ids : np.ndarray
+        Id of every event.
+    anchors : dict
+        Timepoint -> anchor date of every event.
+    climatology : dict or None
+        Output of build_climatology, needed for percentages of normal.
+
+    Returns
+    -------
+    list of np.ndarray
+        Values of every feature (in the order of features), one per event.
+    """
+    invalid = set(features["timepoint"]) - set(anchors)
+    if invalid:
+        raise ValueError(f"Unknown timepoint {sorted(invalid)[0]}. Choose from {', '.join(anchors)}.")
+    if features["pct"].any() and climatology is None:
+        pct_names = features.loc[features["pct"], "name"]
+        raise ValueError(
+            f"{len(pct_names)} features are percentages of normal (e.g. {pct_names.iloc[0]}) "
+            "and need a climatology (see build_climatology)."
+        )
+
+    values = [None] * len(features)
+    for (timepoint, n), windows in features.groupby(["timepoint", "n"], sort=False):
+        lo, hi = window_bounds(index, ids, anchors[timepoint], n)
+        for col, group in windows.groupby("col", sort=False):
+            functions = list(dict.fromkeys(group["func"]))
+            # the mean tells the windows without values apart
+            if group["pct"].any() and "mean" not in functions:
+                functions.append("mean")
+            results = window_statistics(index, col, lo, hi, functions, anchors=anchors[timepoint])
+
+            for row, func, pct in zip(group.index, group["func"], group["pct"]):
+                if not pct or func == "time_min":
+                    values[row] = results[func].to_numpy()
+                    continue
+                normal = climatology_normal(climatology, col, ids, anchors[timepoint], n, func)
+                value = percentage_of_normal(results[func], normal)
+                value[np.isnan(results["mean"].to_numpy())] = np.nan
+                values[row] = value
+        print(timepoint, n)
+    return values
+
+
+def features_wide(base, features, values):
+    """Base columns of the events followed by one column per feature."""
+    columns = {name: value for name, value in zip(features["name"], values)}
+    return pd.concat([base.reset_index(drop=True), pd.DataFrame(columns)], axis=1)
+
+
+def write_features_long(base, features, values, path):
+    """
+    Write the features in long format (base columns of the events, 'env',
+    'n', 'func', 'timepoint', 'pct' and 'value'; one row per event and
+    feature) to a CSV file, one feature at a time, so the long table is never
+    held in memory.
+    """
+    base = base.reset_index(drop=True)
+    for k, feature in enumerate(features.itertuples(index=False)):
+        block = base.assign(
+            env=feature.env, n=feature.n, func=feature.func,
+            timepoint=feature.timepoint, pct=feature.pct, value=values[k]
+        )
+        block.to_csv(path, mode="w" if k == 0 else "a", header=k == 0, index=False)
+
+
+def rolling_features(df, windows, functions=window_functions, envs=feature_envs, group_col="id", date_col="date"):
+    """
+    Window features of every id and day: the functions of the environmental
+    variables over the n days before the day ([date - n days, date)), as in
+    compute_features with every day as anchor. All days are evaluated at once
+    from the structures of build_window_index.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Long-format dataframe with one row per id and date.
+    windows : list of int
+        Window lengths in days.
+    functions : sequence of str
+        Functions (see window_functions).
+    envs : dict
+        Column -> short name of the environmental variables.
+    group_col, date_col : str
+        Names of the id and date columns.
+
+    Returns
+    -------
+    pd.DataFrame
+        The id and date of every day (sorted) and the columns
+        "<function>_<env>_<n>" as float32.
+    """
+    df = df.sort_values([group_col, date_col], ignore_index=True)
+    index = build_window_index(df, list(envs), group_col, date_col)
+    ids = df[group_col].to_numpy()
+    dates = df[date_col].to_numpy(dtype="datetime64[ns]")
+
+    columns = {}
+    for n in windows:
+        lo, hi = window_bounds(index, ids, dates, n)
+        for col, env in envs.items():
+            results = window_statistics(index, col, lo, hi, functions, anchors=dates)
+            for func in functions:
+                columns[f"{func}_{env}_{n}"] = results[func].to_numpy(dtype=np.float32)
+    return pd.concat([df[[group_col, date_col]], pd.DataFrame(columns)], axis=1)
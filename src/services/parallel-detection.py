@@ -0,0 +1,142 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context, shared_memory
+
+
+def split_shards(offsets, n_shards):
+    """
+    Split packed series into at most n_shards contiguous runs of series with
+    roughly the same number of values.
+
+    Parameters
+    ----------
+    offsets : np.ndarray
+        Start offsets of the series (see pack_series).
+    n_shards : int
+        Number of shards.
+
+    Returns
+    -------
+    np.ndarray
+        Series bounds: shard k holds series bounds[k] to bounds[k + 1] - 1.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_series = len(offsets) - 1
+    targets = np.linspace(0, offsets[-1], n_shards + 1)
+    bounds = np.searchsorted(offsets[:-1], targets[1:-1])
+    return np.unique(np.concatenate([[0], bounds, [n_series]]))
+
+
+def to_shared_memory(array):
+    """
+    Copy an array into a new shared memory block.
+
+    Returns
+    -------
+    shm : shared_memory.SharedMemory
+        The block; the caller closes and unlinks it.
+    spec : tuple
+        (name, shape, dtype) to attach to the block from another process.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm, (shm.name, array.shape, array.dtype)
+
+
+def detect_shard(detector, specs, offsets, series_args, params):
+    """
+    Worker: attach to the shared dates and values and run the detector on one
+    shard of series.
+    """
+    blocks = [shared_memory.SharedMemory(name=name) for name, _shape, _dtype in specs]
+    try:
+        dates, values = (
+            np.ndarray(shape, dtype=dtype, buffer=block.buf)[offsets[0]:offsets[-1]]
+            for block, (_name, shape, dtype) in zip(blocks, specs)
+        )
+        events = detector(dates, values, offsets - offsets[0], *series_args, **params)
+        del dates, values
+    finally:
+        for block in blocks:
+            block.close()
+    return events
+
+
+def detect_events_parallel(detector, dates, values, offsets, series_args=(), n_workers=None, **params):
+    """
+    Run an event detector on packed series (see pack_series) with the series
+    sharded across worker processes. Dates and values are placed in shared
+    memory once, so the workers do not receive copies of them.
+
+    Parameters
+    ----------
+    detector : callable
+        detector(dates, values, offsets, *series_args, **params) returning a
+        dataframe of events with a 'series' column numbering the series
+        within the given arrays (e.g. detect_shrinking_events_batch).
+    dates, values : np.ndarray
+        Packed dates and values.
+    offsets : np.ndarray
+        Start offsets of the series.
+    series_args : tuple of np.ndarray
+        Arguments with one entry per series (e.g. amplitudes); every worker
+        gets the entries of its shard.
+    n_workers : int or None
+        Number of worker processes (default: all cores). With 1, or where
+        processes cannot be forked, the detector runs in this process.
+    **params
+        Further keyword arguments of the detector.
+
+    Returns
+    -------
+    pd.DataFrame
+        The events of all shards in series order, with 'series' numbering
+        all series; the result does not depend on n_workers.
+    """
+    dates = np.asarray(dates)
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    series_args = tuple(np.asarray(arg) for arg in series_args)
+    n_workers = n_workers or os.cpu_count()
+
+    # workers are forked: the scripts run their top level when imported, which rules out spawning
+    if n_workers == 1 or len(offsets) <= 2 or "fork" not in get_all_start_methods():
+        return detector(dates, values, offsets, *series_args, **params)
+
+    bounds = split_shards(offsets, n_workers)
+    blocks = []
+    try:
+        specs = []
+        for array in (dates, values):
+            block, spec = to_shared_memory(array)
+            blocks.append(block)
+            specs.append(spec)
+
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=get_context("fork")) as pool:
+            futures = [
+                pool.submit(
+                    detect_shard, detector, specs,
+                    offsets[lo:hi + 1],
+                    tuple(arg[lo:hi] for arg in series_args),
+                    params
+                )
+                for lo, hi in zip(bounds[:-1], bounds[1:])
+            ]
+            shards = [future.result() for future in futures]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    # merge in shard order, so the result is the same for every number of workers
+    frames = []
+    for lo, events in zip(bounds[:-1], shards):
+        if len(events) > 0:
+            events = events.copy()
+            events["series"] += lo
+            frames.append(events)
+    if not frames:
+        return shards[0]
+    return pd.concat(frames, ignore_index=True)
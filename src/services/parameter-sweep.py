@@ -0,0 +1,150 @@
+import itertools
+import numpy as np
+import pandas as pd
+
+exec(open('src/services/shrinking-detector.py').read())
+
+
+def parameter_grid(**values):
+    """
+    All combinations of parameter values.
+
+    Parameters
+    ----------
+    **values
+        Parameter name -> list of values (a single value is kept fixed).
+
+    Returns
+    -------
+    list of dict
+        One dict of parameters per combination.
+    """
+    names = list(values)
+    options = [v if isinstance(v, (list, tuple, np.ndarray)) else [v] for v in values.values()]
+    return [dict(zip(names, combination)) for combination in itertools.product(*options)]
+
+
+def prepare_sweep(df, group_col="id", date_col="date", value_col="D_mean"):
+    """
+    Pack the series of all ids and build everything the detectors need that
+    does not depend on their parameters (sparse tables of the running extrema,
+    runs of daily increases), once for all combinations of a sweep.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Long-format dataframe sorted by group_col and date_col, without missing values in value_col.
+    group_col, date_col, value_col : str
+        Names of the id, date and value columns.
+
+    Returns
+    -------
+    dict
+        'keys', 'dates', 'values', 'offsets' (see pack_series) and 'tables'
+        (see series_tables).
+    """
+    keys, dates, values, offsets = pack_series(df, group_col, date_col, value_col)
+    return {
+        "keys": keys,
+        "dates": dates,
+        "values": values,
+        "offsets": offsets,
+        "tables": series_tables(values, offsets),
+    }
+
+
+def summarize_events(events, n_series, duration_col, pct_col):
+    """
+    Event counts and summary statistics of one detector run.
+
+    Parameters
+    ----------
+    events : pd.DataFrame
+        Events with a 'series' column.
+    n_series : int
+        Number of series searched.
+    duration_col, pct_col : str
+        Names of the duration (days) and shrinkage (% of amplitude) columns.
+
+    Returns
+    -------
+    dict
+    """
+    return {
+        "n_events": len(events),
+        "n_ids_with_events": events["series"].nunique(),
+        "events_per_id": len(events) / n_series if n_series else np.nan,
+        "mean_duration": events[duration_col].mean(),
+        "median_duration": events[duration_col].median(),
+        "mean_shrink_pct": events[pct_col].mean(),
+        "max_shrink_pct": events[pct_col].max(),
+    }
+
+
+def sweep_shrinking_events(prepared, amps, grid):
+    """
+    Run detect_shrinking_events_batch for every parameter combination of a grid.
+
+    Parameters
+    ----------
+    prepared : dict
+        Output of prepare_sweep.
+    amps : np.ndarray
+        Amplitude of every series.
+    grid : list of dict
+        Combinations of min_shrink_pct, max_duration, min_duration and
+        rebound_tolerance (see parameter_grid).
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per combination: the parameters followed by the event counts
+        and statistics (see summarize_events).
+    """
+    n_series = len(prepared["offsets"]) - 1
+    rows = []
+    for params in grid:
+        events = detect_shrinking_events_batch(
+            prepared["dates"], prepared["values"], prepared["offsets"], amps,
+            tables=prepared["tables"], **params
+        )
+        rows.append({**params, **summarize_events(events, n_series, "duration", "shrinkage_pct")})
+    return pd.DataFrame(rows)
+
+
+def sweep_nested_events(prepared, amps, grid):
+    """
+    Run detect_nested_events_batch for every parameter combination of a grid.
+
+    Parameters
+    ----------
+    prepared : dict
+        Output of prepare_sweep.
+    amps : np.ndarray
+        Amplitude of every series.
+    grid : list of dict
+        Combinations of parameters of detect_nested_events (see parameter_grid).
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per combination: the parameters followed by the event counts
+        and statistics (see summarize_events), the number of outer and nested
+        events, the deepest nesting and the mean duration until recovery.
+    """
+    n_series = len(prepared["offsets"]) - 1
+    rows = []
+    for params in grid:
+        events = detect_nested_events_batch(
+            prepared["dates"], prepared["values"], prepared["offsets"], amps,
+            tables=prepared["tables"], **params
+        )
+        rows.append({
+            **params,
+            **summarize_events(events, n_series, "shrink_days", "shrink_pct"),
+            "n_outer": int((events["depth"] == 0).sum()),
+            "n_nested": int((events["depth"] > 0).sum()),
+            "max_depth": events["depth"].max(),
+            "mean_total_days": events["total_days"].mean(),
+        })
+    return pd.DataFrame(rows)
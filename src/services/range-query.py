@@ -0,0 +1,188 @@
+import numpy as np
+
+
+def sparse_table(values, op=np.minimum):
+    """
+    Build a sparse table for O(1) range minimum (or maximum) queries.
+
+    Row k holds op over the 2**k values starting at each position. Positions
+    where the block would run past the end are padded with the identity of op
+    (+inf for np.minimum, -inf for np.maximum).
+
+    Parameters
+    ----------
+    values : np.ndarray
+        1-dimensional array of floats.
+    op : np.ufunc
+        np.minimum (default) or np.maximum.
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (floor(log2(n)) + 1, n).
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    fill = np.inf if op is np.minimum else -np.inf
+    n_levels = max(int(np.log2(n)) + 1, 1) if n > 0 else 1
+
+    table = np.full((n_levels, n), fill)
+    table[0] = values
+    for k in range(1, n_levels):
+        half = 1 << (k - 1)
+        width = n - (1 << k) + 1
+        table[k, :width] = op(table[k - 1, :width], table[k - 1, half:half + width])
+    return table
+
+
+def cached_sparse_table(structures, op=np.minimum):
+    """
+    Sparse table of the range minima (or maxima) of structures['values'],
+    built on first use and kept in structures as 'min_table' ('max_table').
+    Missing values are replaced by the identity of op, so they never win.
+    """
+    name = "min_table" if op is np.minimum else "max_table"
+    if name not in structures:
+        values = structures["values"].ravel()
+        fill = np.inf if op is np.minimum else -np.inf
+        structures[name] = sparse_table(np.where(np.isnan(values), fill, values), op=op)
+    return structures[name]
+
+
+def range_query(table, a, b, op=np.minimum):
+    """
+    Query op over the inclusive index ranges [a, b] (vectorized).
+
+    Parameters
+    ----------
+    table : np.ndarray
+        Sparse table built with the same op.
+    a, b : np.ndarray
+        Start and end indices with a <= b.
+    op : np.ufunc
+        np.minimum (default) or np.maximum.
+
+    Returns
+    -------
+    np.ndarray
+        op(values[a:b+1]) for every pair.
+    """
+    a = np.asarray(a)
+    b = np.asarray(b)
+    k = np.log2(b - a + 1).astype(int)
+    return op(table[k, a], table[k, b - (1 << k) + 1])
+
+
+def first_index(table, a, b, predicate):
+    """
+    Find the first index j in [a, b] whose value satisfies predicate, for many
+    ranges at once (binary lifting over the sparse table, O(log n) vectorized steps).
+
+    The predicate must be monotone in the sense that if it holds for a value
+    it also holds for every more extreme one in the direction of the table
+    (every smaller value for a minimum table, every larger for a maximum
+    table), e.g. lambda m: m < x for a minimum table.
+
+    Parameters
+    ----------
+    table : np.ndarray
+        Sparse table of the values (see sparse_table).
+    a, b : np.ndarray
+        Start and end indices of the ranges. Ranges with a > b are empty.
+    predicate : callable
+        Vectorized function of the block extremes returning a boolean array.
+        It is called with an index array 'rows' as second argument, selecting
+        the ranges the extremes belong to, so it can compare against per-range
+        thresholds.
+
+    Returns
+    -------
+    np.ndarray
+        First matching index per range, or -1 if there is none.
+    """
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    n = table.shape[1]
+    pos = a.copy()
+
+    # no block is longer than the longest range
+    longest = int(np.max(b - a + 1, initial=1))
+    top = min(table.shape[0] - 1, int(np.log2(max(longest, 1))))
+
+    for k in range(top, -1, -1):
+        # extend over the next 2**k values wherever none of them matches
+        rows = np.flatnonzero(pos + (1 << k) - 1 <= b)
+        if len(rows) == 0:
+            continue
+        skip = ~predicate(table[k, pos[rows]], rows)
+        pos[rows[skip]] += 1 << k
+
+    found = np.full(len(a), -1, dtype=np.int64)
+    rows = np.flatnonzero((pos <= b) & (pos < n))
+    match = predicate(table[0, pos[rows]], rows)
+    found[rows[match]] = pos[rows[match]]
+    return found
+
+
+def first_at_least(table, a, b, thresholds):
+    """
+    Find the first index j in [a, b] with values[j] >= threshold, for many
+    ranges at once (e.g. the recovery of shrinking events), in O(log n).
+
+    Parameters
+    ----------
+    table : np.ndarray
+        Sparse table of the range maxima (sparse_table(values, op=np.maximum)).
+    a, b : array-like or int
+        Start and end indices of the ranges. Ranges with a > b are empty.
+    thresholds : array-like or float
+        Threshold of every range.
+
+    Returns
+    -------
+    np.ndarray or int
+        First index per range, or -1 if there is none (an int for a single
+        range given as scalars).
+    """
+    if np.ndim(a) == 0:
+        # single range: plain binary lifting without the overhead of array operations
+        pos, b, threshold = int(a), int(b), float(thresholds)
+        top = min(table.shape[0] - 1, int(np.log2(max(b - pos + 1, 1))))
+        for k in range(top, -1, -1):
+            if pos + (1 << k) - 1 <= b and table[k, pos] < threshold:
+                pos += 1 << k
+        return pos if pos <= b and table[0, pos] >= threshold else -1
+
+    a = np.asarray(a, dtype=np.int64)
+    thresholds = np.broadcast_to(np.asarray(thresholds, dtype=float), a.shape)
+    return first_index(table, a, b, lambda m, rows: m >= thresholds[rows])
+
+
+def run_length_increasing(values, offsets=None):
+    """
+    Number of consecutive increases (values[k] > values[k-1]) ending at every index.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        1-dimensional array of floats.
+    offsets : np.ndarray or None
+        Start offsets of the series packed into values (see pack_series).
+        No increase is counted across the start of a series.
+
+    Returns
+    -------
+    np.ndarray
+        Integer array of the same length; 0 where values did not increase.
+    """
+    values = np.asarray(values, dtype=float)
+    increase = np.zeros(len(values), dtype=bool)
+    increase[1:] = values[1:] > values[:-1]
+    if offsets is not None:
+        starts = np.asarray(offsets[:-1], dtype=np.int64)
+        increase[starts[starts < len(values)]] = False
+
+    # index of the last position without an increase, for every position
+    idx = np.arange(len(values))
+    last_reset = np.maximum.accumulate(np.where(increase, 0, idx))
+    return idx - last_reset
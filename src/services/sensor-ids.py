@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+id_levels = ["country", "site", "individuum", "branch", "section", "radius"]
+
+
+def build_sensor_table(ids, sensors=None):
+    """
+    Parse sensor ids (country.site.individuum.branch.section.radius) into a
+    dimension table with one row per id, an integer 'id_code' and an integer
+    code next to every level of the hierarchy.
+
+    Parameters
+    ----------
+    ids : iterable of str
+        Sensor ids to add.
+    sensors : pd.DataFrame or None
+        An existing sensor table to extend. Known ids and level values keep
+        their codes, so codes already stored with the measurements stay valid.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns 'id_code', 'id', and '<level>' / '<level>_code' for every level.
+    """
+    known = [] if sensors is None else list(sensors["id"])
+    new = sorted(set(ids) - set(known))
+    all_ids = pd.Series(known + new, dtype=object)
+
+    parts = all_ids.str.split(".", expand=True)
+    parts.columns = id_levels
+
+    dim = pd.DataFrame({"id_code": np.arange(len(all_ids), dtype=np.int16), "id": all_ids})
+    for level in id_levels:
+        # codes follow the order of first appearance, so extending the table keeps old codes
+        codes, _uniques = pd.factorize(parts[level])
+        dim[level] = parts[level]
+        dim[f"{level}_code"] = codes.astype(np.int16)
+
+    return dim
+
+
+def encode_sensor_ids(df, sensors, id_col="id"):
+    """
+    Add the integer 'id_code' and the level codes of the sensor table to df.
+    """
+    codes = sensors.set_index("id")[["id_code"] + [f"{level}_code" for level in id_levels]]
+    return df.join(codes, on=id_col)
+
+
+def attach_sensor_levels(df, sensors, levels):
+    """
+    Decode hierarchy levels (e.g. ['site', 'individuum']) from the 'id_code'
+    column of df, as categoricals.
+    """
+    lookup = sensors.set_index("id_code")
+    for level in levels:
+        df[level] = df["id_code"].map(lookup[level]).astype("category")
+    return df
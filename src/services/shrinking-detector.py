@@ -0,0 +1,500 @@
+import numpy as np
+import pandas as pd
+
+exec(open('src/services/range-query.py').read())
+
+
+def pack_series(df, group_col="id", date_col="date", value_col="D_mean"):
+    """
+    Pack the series of all ids into contiguous arrays.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Long-format dataframe sorted by group_col and date_col, without missing values in value_col.
+    group_col, date_col, value_col : str
+        Names of the id, date and value columns.
+
+    Returns
+    -------
+    keys : np.ndarray
+        The id of every series.
+    dates : np.ndarray
+        Dates of all series, one after the other.
+    values : np.ndarray
+        Values of all series, one after the other.
+    offsets : np.ndarray
+        Series k occupies positions offsets[k] to offsets[k + 1] - 1.
+    """
+    groups = df[group_col].to_numpy()
+    starts = np.flatnonzero(groups[1:] != groups[:-1]) + 1
+    if len(groups) == 0:
+        offsets = np.zeros(1, dtype=np.int64)
+    else:
+        offsets = np.concatenate([[0], starts, [len(groups)]]).astype(np.int64)
+    keys = groups[offsets[:-1]]
+    return keys, df[date_col].to_numpy(), df[value_col].to_numpy(dtype=float), offsets
+
+
+def scan_event_ends(values, table, breaks, starts, last_index, thresholds, max_duration, min_duration, rebound_tolerance):
+    """
+    For the given start indices, find the index at which a forward scan from
+    the start (as in detect_shrinking_events) records a shrinking event.
+
+    The scan from i records the event at the first j that
+    - sets a new running minimum (values[j] < min(values[i:j])),
+    - lies at least min_duration - 1 days after i,
+    - drops at least threshold below values[i],
+    - is at most max_duration days after i and at most last_index, and
+    - comes before the first rebound, i.e. the first index at least
+      rebound_tolerance + 1 days after i that ends more than
+      rebound_tolerance consecutive increases.
+    This is the first j in the allowed range below the minimum of
+    values[i:i + min_duration - 1] that meets the threshold, which is answered
+    with range minimum queries.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Stem diameter values, without missing values.
+    table : np.ndarray
+        Sparse table of the range minima of values (see sparse_table).
+    breaks : np.ndarray
+        Sorted indices that end more than rebound_tolerance consecutive
+        increases. Because a break only counts rebound_tolerance + 1 days
+        after the start, they can be computed once for a whole series and
+        used for scans of any part of it.
+    starts : np.ndarray
+        Start indices of the scans.
+    last_index : np.ndarray or int
+        Last index every scan may reach (e.g. the end of its series).
+    thresholds : np.ndarray or float
+        Minimum shrinkage of an event for every scan; NaN for no events.
+    max_duration : int
+        Maximum days over which shrinkage can occur.
+    min_duration : int
+        Minimum duration (days, start and end included) of an event.
+    rebound_tolerance : int
+        Max consecutive days of increase tolerated within an event.
+
+    Returns
+    -------
+    np.ndarray
+        Index of the event end for every start, -1 where no event starts.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    last_index = np.broadcast_to(np.asarray(last_index, dtype=np.int64), starts.shape)
+    threshold = np.broadcast_to(np.asarray(thresholds, dtype=float), starts.shape)
+    ends = np.full(len(starts), -1, dtype=np.int64)
+
+    k = np.searchsorted(breaks, starts + rebound_tolerance + 1)
+    rebound = np.append(breaks, len(values))[k]
+
+    first = np.maximum(starts + 1, starts + min_duration - 1)
+    last = np.minimum.reduce([last_index, starts + max_duration, rebound - 1])
+    scanned = (first <= last) & ~np.isnan(threshold)
+
+    if min_duration <= 1:
+        # where every scanned day meets the threshold the scan stops on the first one
+        trivial = np.flatnonzero(scanned & (threshold <= 0))
+        i = starts[trivial]
+        ends[trivial] = np.where(values[i + 1] < values[i], i + 1, i)
+        scanned &= threshold > 0
+
+    valid = np.flatnonzero(scanned)
+    if len(valid) == 0:
+        return ends
+
+    # minimum before the first index at which an event can be recorded
+    i = starts[valid]
+    prefix_min = range_query(table, i, np.clip(first[valid] - 1, i, last_index[valid]))
+
+    def is_event_end(m, rows):
+        return (m < prefix_min[rows]) & (values[i[rows]] - m >= threshold[valid[rows]])
+
+    ends[valid] = first_index(table, first[valid], last[valid], is_event_end)
+    return ends
+
+
+def series_tables(values, offsets=None):
+    """
+    Structures of packed series that do not depend on the detection
+    parameters, so they can be built once and shared by many detector runs
+    (e.g. a parameter sweep).
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Packed stem diameter series, without missing values.
+    offsets : np.ndarray or None
+        Start offsets of the series (see pack_series).
+
+    Returns
+    -------
+    dict
+        'values', sparse tables of the range minima ('min_table') and maxima
+        ('max_table') and the number of consecutive increases ending at every
+        index ('run_length').
+    """
+    values = np.asarray(values, dtype=float)
+    return {
+        "values": values,
+        "min_table": sparse_table(values),
+        "max_table": sparse_table(values, op=np.maximum),
+        "run_length": run_length_increasing(values, offsets),
+    }
+
+
+def find_event_ends(values, offsets, thresholds, max_duration, min_duration, rebound_tolerance, tables=None):
+    """
+    Find the event end of the forward scan from every index of all packed
+    series at once (see scan_event_ends).
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Packed stem diameter series, each sorted by date, without missing values.
+    offsets : np.ndarray
+        Start offsets of the series (see pack_series).
+    thresholds : np.ndarray
+        Minimum shrinkage of an event for every series; NaN for no events.
+    max_duration, min_duration, rebound_tolerance : int
+        See scan_event_ends.
+    tables : dict or None
+        series_tables of values and offsets, if already built.
+
+    Returns
+    -------
+    np.ndarray
+        Index of the event end for every start index, -1 where no event starts.
+    """
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n = len(values)
+    if n == 0:
+        return np.full(0, -1, dtype=np.int64)
+
+    if tables is None:
+        tables = {"min_table": sparse_table(values), "run_length": run_length_increasing(values, offsets)}
+    series = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    breaks = np.flatnonzero(tables["run_length"] > rebound_tolerance)
+
+    return scan_event_ends(
+        values, tables["min_table"], breaks,
+        np.arange(n), offsets[1:][series] - 1, np.asarray(thresholds, dtype=float)[series],
+        max_duration, min_duration, rebound_tolerance
+    )
+
+
+def detect_shrinking_events_batch(dates, values, offsets, amps, min_shrink_pct, max_duration, min_duration, rebound_tolerance, tables=None):
+    """
+    Detect shrinking events of all packed series in one call: periods where
+    stem diameter drops by at least min_shrink_pct% of amplitude, with
+    tolerance for brief rebounds.
+
+    Gives the same events as the forward scan from every start index, but
+    finds the end of the scan from all starts at once (find_event_ends) and
+    then only walks from event to event. A scan that stops at a rebound
+    continues at the next day.
+
+    Parameters
+    ----------
+    dates : np.ndarray
+        Packed dates (see pack_series).
+    values : np.ndarray
+        Packed stem diameter series, each sorted by date, without missing values.
+    offsets : np.ndarray
+        Start offsets of the series.
+    amps : np.ndarray
+        Amplitude of every series; thresholds are relative to it. Series with
+        an amplitude of 0 or NaN have no events.
+    min_shrink_pct : float
+        Minimum shrinkage as % of amplitude.
+    max_duration : int
+        Maximum days over which shrinkage can occur.
+    min_duration : int
+        Minimum duration to count as an event.
+    rebound_tolerance : int
+        Max consecutive days of increase tolerated within an event.
+    tables : dict or None
+        series_tables of values and offsets, if already built.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per event with the series number, start/end index within the
+        series, start/end date and value, shrinkage, shrinkage in % of
+        amplitude and duration.
+    """
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    amps = np.asarray(amps, dtype=float)
+    n = len(values)
+
+    thresholds = np.where(amps == 0, np.nan, amps * (min_shrink_pct / 100.0))
+    ends = find_event_ends(values, offsets, thresholds, max_duration, min_duration, rebound_tolerance, tables)
+
+    # next start index at or after every position from which an event is recorded
+    next_start = np.where(ends >= 0, np.arange(n), n)
+    next_start = np.append(np.minimum.accumulate(next_start[::-1])[::-1], n)
+
+    # events never overlap and never cross series, so one walk covers all series
+    event_starts = []
+    i = next_start[0]
+    while i < n:
+        event_starts.append(i)
+        i = next_start[ends[i] + 1]
+
+    start = np.asarray(event_starts, dtype=np.int64)
+    end = ends[start]
+    series = np.searchsorted(offsets, start, side="right") - 1
+    shrinkage = values[start] - values[end]
+
+    return pd.DataFrame({
+        "series": series,
+        "start_idx": start - offsets[series],
+        "end_idx": end - offsets[series],
+        "start_date": dates[start],
+        "end_date": dates[end],
+        "start_val": values[start],
+        "end_val": values[end],
+        "shrinkage": shrinkage,
+        "shrinkage_pct": (shrinkage / amps[series]) * 100,
+        "duration": end - start + 1,
+    })
+
+
+def detect_shrinking_events_linear(dates, values, amp, min_shrink_pct, max_duration, min_duration, rebound_tolerance):
+    """
+    Detect the shrinking events of a single series, see detect_shrinking_events_batch.
+
+    Returns
+    -------
+    list of dict
+        One dict per event with start/end index, date and value, shrinkage,
+        shrinkage in % of amplitude and duration.
+    """
+    events = detect_shrinking_events_batch(
+        np.asarray(dates), values, [0, len(values)], [amp],
+        min_shrink_pct, max_duration, min_duration, rebound_tolerance
+    )
+    return events.drop(columns="series").to_dict("records")
+
+
+def nested_event_type(depth):
+    """Name of the events at a nesting depth: 'outer', 'inner', 'inner_2', ..."""
+    if depth == 0:
+        return "outer"
+    if depth == 1:
+        return "inner"
+    return f"inner_{depth}"
+
+
+def detect_recovery_events(tables, breaks, lo, hi, amp, min_shrink_pct, recovery_pct, max_duration, min_duration, rebound_tolerance):
+    """
+    Detect the shrinking events with recovery within the index range [lo, hi)
+    of one series, as detect_shrinking_events in shrinking-events.jl does on
+    the values of that range.
+
+    An event starts at the maximum before its minimum and recovers at the
+    first later day that regains recovery_pct% of the shrinkage (the last day
+    of the range if none does). The search for the next event continues after
+    the recovery.
+
+    Parameters
+    ----------
+    tables : dict
+        series_tables of the values.
+    breaks : np.ndarray
+        Sorted indices of the series that end more than rebound_tolerance
+        consecutive increases.
+    lo, hi : int
+        Index range to search.
+    amp : float
+        Amplitude the threshold is relative to; 0 or NaN for no events.
+    min_shrink_pct : float
+        Minimum shrinkage as % of amplitude.
+    recovery_pct : float
+        Share of the shrinkage (%) to regain for recovery.
+    max_duration, min_duration, rebound_tolerance : int
+        See scan_event_ends.
+
+    Returns
+    -------
+    list of tuple
+        (start_idx, end_idx, recovery_idx, threshold) of every event, with
+        indices into the values.
+    """
+    if np.isnan(amp) or amp == 0:
+        return []
+    values = tables["values"]
+    threshold = amp * (min_shrink_pct / 100.0)
+
+    starts = np.arange(lo, hi)
+    ends = scan_event_ends(
+        values, tables["min_table"], breaks, starts, hi - 1, threshold,
+        max_duration, min_duration, rebound_tolerance
+    )
+    candidates = starts[ends >= 0]
+
+    events = []
+    k = 0
+    while k < len(candidates):
+        i = candidates[k]
+        end = ends[i - lo]
+        start = i + int(np.argmax(values[i:end])) if end > i else i
+
+        recovery_threshold = values[end] + (values[start] - values[end]) * recovery_pct / 100.0
+        recovery = first_at_least(tables["max_table"], end + 1, hi - 1, recovery_threshold)
+        if recovery < 0:
+            recovery = hi - 1
+
+        events.append((start, end, recovery, threshold))
+        k = np.searchsorted(candidates, recovery + 1)
+    return events
+
+
+def nested_event_rows(tables, lo, hi, amp, min_shrink_pct=10.0, recovery_pct=95.0,
+                      nested_min_shrink_pct=15.0, nested_recovery_pct=80.0, max_nesting_depth=10,
+                      max_duration=60, min_duration=2, rebound_tolerance=15):
+    """
+    Detect the nested events of the series at [lo, hi) of the values in
+    tables (see detect_nested_events).
+
+    Nested ranges are kept as index ranges on an explicit work stack, so all
+    depths search the same values array and share its sparse tables.
+
+    Returns
+    -------
+    list of tuple
+        (start_idx, end_idx, recovery_idx, threshold, amplitude, depth,
+        parent start_idx or -1) of every event.
+    """
+    breaks = lo + np.flatnonzero(tables["run_length"][lo:hi] > rebound_tolerance)
+
+    # (lo, hi, amplitude, depth, parent start index) of the ranges still to search
+    stack = [(lo, hi, amp, 0, -1)] if hi > lo and max_nesting_depth > 0 else []
+    rows = []
+    while stack:
+        range_lo, range_hi, range_amp, depth, parent = stack.pop()
+        shrink_pct, rec_pct = (min_shrink_pct, recovery_pct) if depth == 0 else (nested_min_shrink_pct, nested_recovery_pct)
+
+        events = detect_recovery_events(
+            tables, breaks, range_lo, range_hi, range_amp, shrink_pct, rec_pct,
+            max_duration, min_duration, rebound_tolerance
+        )
+        for start, end, recovery, threshold in events:
+            rows.append((start, end, recovery, threshold, range_amp, depth, parent))
+            if depth + 1 < max_nesting_depth:
+                nested_amp = (
+                    range_query(tables["max_table"], end, recovery, op=np.maximum)
+                    - range_query(tables["min_table"], end, recovery)
+                )
+                stack.append((end, recovery + 1, float(nested_amp), depth + 1, start))
+    return rows
+
+
+def nested_events_frame(dates, values, rows):
+    """
+    Dataframe of nested event rows (see nested_event_rows) with the columns
+    of shrinking-events.jl except id.
+    """
+    start, end, recovery, depth, parent = (
+        np.array([row[k] for row in rows], dtype=np.int64) for k in (0, 1, 2, 5, 6)
+    )
+    threshold, range_amp = (np.array([row[k] for row in rows], dtype=float) for k in (3, 4))
+
+    start_ts, end_ts, recovery_ts = (pd.to_datetime(pd.Series(dates[idx])) for idx in (start, end, recovery))
+    parent_ts = pd.to_datetime(pd.Series(dates[np.maximum(parent, 0)])).where(parent >= 0)
+    shrinkage = values[start] - values[end]
+
+    return pd.DataFrame({
+        "year": start_ts.dt.year,
+        "start": start_ts,
+        "stop": end_ts,
+        "recovery": recovery_ts,
+        "shrink_days": end - start + 1,
+        "total_days": recovery - start + 1,
+        "start_doy": start_ts.dt.dayofyear,
+        "end_doy": end_ts.dt.dayofyear,
+        "recovery_doy": recovery_ts.dt.dayofyear,
+        "start_D_mean": values[start],
+        "end_D_mean": values[end],
+        "recovery_D_mean": values[recovery],
+        "total_shrink": shrinkage,
+        "shrink_threshold": threshold,
+        "shrink_pct": (shrinkage / range_amp) * 100,
+        "depth": depth,
+        "event_type": [nested_event_type(d) for d in depth],
+        "parent_start": parent_ts,
+    })
+
+
+def detect_nested_events(dates, values, amp, **params):
+    """
+    Detect shrinking events of one series and, recursively, the events nested
+    in their recovery phase (from the minimum to the recovery), as
+    detect_nested_events in shrinking-events.jl.
+
+    Parameters
+    ----------
+    dates : np.ndarray
+        Dates of the series, sorted and unique.
+    values : np.ndarray
+        Stem diameter values, without missing values.
+    amp : float
+        Amplitude of the series; thresholds of outer events are relative to
+        it. The amplitude of a nested range is the range of its values.
+    **params
+        min_shrink_pct, recovery_pct : float
+            Minimum shrinkage (% of amplitude) and recovery (% of shrinkage)
+            of outer events (default: 10, 95).
+        nested_min_shrink_pct, nested_recovery_pct : float
+            The same for nested events (default: 15, 80).
+        max_nesting_depth : int
+            Number of depths searched; outer events have depth 0 (default: 10).
+        max_duration, min_duration, rebound_tolerance : int
+            See scan_event_ends (default: 60, 2, 15).
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per event, sorted by start and depth, with the columns of
+        shrinking-events.jl except id.
+    """
+    tables = series_tables(values)
+    rows = nested_event_rows(tables, 0, len(tables["values"]), amp, **params)
+    events = nested_events_frame(np.asarray(dates), tables["values"], rows)
+    return events.sort_values(["start", "depth"], ignore_index=True)
+
+
+def detect_nested_events_batch(dates, values, offsets, amps, tables=None, **params):
+    """
+    Detect the nested events of all packed series (see pack_series and
+    detect_nested_events), e.g. as detector of detect_events_parallel.
+
+    Parameters
+    ----------
+    tables : dict or None
+        series_tables of values and offsets, if already built.
+
+    Returns
+    -------
+    pd.DataFrame
+        The events of all series in series order, with a 'series' column
+        numbering the series.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if tables is None:
+        tables = series_tables(values, offsets)
+
+    rows = []
+    series = []
+    for k, (lo, hi) in enumerate(zip(offsets[:-1], offsets[1:])):
+        series_rows = nested_event_rows(tables, lo, hi, amps[k], **params)
+        rows += series_rows
+        series += [k] * len(series_rows)
+
+    events = nested_events_frame(np.asarray(dates), tables["values"], rows)
+    events.insert(0, "series", np.array(series, dtype=np.int64))
+    return events.sort_values(["series", "start", "depth"], ignore_index=True)
@@ -0,0 +1,105 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+
+def stream_sheet_to_parquet(ws, out_dir, var_name, value_name, chunk_size=20000):
+    """
+    Stream the rows of one wide worksheet in chunks, transpose every chunk to
+    long format and write it to a year-partitioned Parquet dataset.
+
+    Parameters
+    ----------
+    ws : openpyxl worksheet
+        A worksheet of a workbook opened with read_only=True. The first row
+        holds the header with a 'datetime' column and one column per sensor.
+    out_dir : str
+        Directory of the dataset for this sheet (e.g. 'input/raw/sheet=D').
+    var_name : str
+        Name of the column holding the former header (e.g. 'id' or 'site').
+    value_name : str
+        Name of the column holding the measurements.
+    chunk_size : int
+        Number of worksheet rows held in memory at once (default: 20000).
+
+    Returns
+    -------
+    int
+        Number of long-format rows written.
+    """
+    rows = ws.iter_rows(values_only=True)
+    header = [str(col) for col in next(rows)]
+
+    n_rows = 0
+    n_chunk = 0
+    chunk = []
+
+    def write_chunk(chunk, n_chunk):
+        df = pd.DataFrame.from_records(chunk, columns=header)
+        df["datetime"] = pd.to_datetime(df["datetime"])
+        df = df.dropna(subset=["datetime"])
+
+        df_long = df.melt(
+            id_vars=["datetime"],
+            var_name=var_name,
+            value_name=value_name
+        )
+        df_long[value_name] = pd.to_numeric(df_long[value_name], errors="coerce")
+
+        for year, part in df_long.groupby(df_long["datetime"].dt.year):
+            part_dir = os.path.join(out_dir, f"year={year}")
+            os.makedirs(part_dir, exist_ok=True)
+            pq.write_table(
+                pa.Table.from_pandas(part, preserve_index=False),
+                os.path.join(part_dir, f"part-{n_chunk:05d}.parquet")
+            )
+
+        return len(df_long)
+
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            n_rows += write_chunk(chunk, n_chunk)
+            n_chunk += 1
+            chunk = []
+
+    if chunk:
+        n_rows += write_chunk(chunk, n_chunk)
+
+    return n_rows
+
+
+def stream_workbook_to_parquet(filepath, out_dir, sheets, chunk_size=20000):
+    """
+    Open the workbook once and stream every requested sheet into a Parquet
+    dataset partitioned by sheet and year (e.g. 'raw/sheet=D/year=2013/').
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the Excel workbook.
+    out_dir : str
+        Root directory of the partitioned dataset.
+    sheets : dict
+        Maps sheet names to the name of their header column after
+        transposing, e.g. {'D': 'id', 'AT': 'site'}.
+    chunk_size : int
+        Number of worksheet rows held in memory at once (default: 20000).
+    """
+    wb = load_workbook(filepath, read_only=True, data_only=True)
+
+    try:
+        for sheet, var_name in sheets.items():
+            sheet_dir = os.path.join(out_dir, f"sheet={sheet}")
+            if os.path.isdir(sheet_dir):
+                for root, _dirs, files in os.walk(sheet_dir):
+                    for f in files:
+                        if f.endswith(".parquet"):
+                            os.remove(os.path.join(root, f))
+
+            n_rows = stream_sheet_to_parquet(wb[sheet], sheet_dir, var_name, sheet, chunk_size)
+            print(f"Sheet {sheet} streamed to {sheet_dir} ({n_rows} rows).")
+    finally:
+        wb.close()
@@ -0,0 +1,242 @@
+import json
+import numpy as np
+import pandas as pd
+
+
+def new_stream_state(amp, min_shrink_pct=10.0, recovery_pct=95.0, max_duration=60, min_duration=2, rebound_tolerance=15):
+    """
+    Initial state of the streaming shrinking event detector of one id.
+
+    The detector follows the outer events of detect_shrinking_events in
+    shrinking-events.jl (see detect_recovery_events): an event is detected
+    once the drop from the start meets the threshold, starts at the maximum
+    before its minimum and recovers at the first day that regains
+    recovery_pct% of the shrinkage. The search for the next event continues
+    after the recovery.
+
+    The state only holds plain values, so it can be stored as JSON between
+    updates (see save_stream_states).
+
+    Parameters
+    ----------
+    amp : float
+        Amplitude of the id (e.g. of previous seasons); the threshold is
+        relative to it. 0 or NaN for no events.
+    min_shrink_pct : float
+        Minimum shrinkage as % of amplitude.
+    recovery_pct : float
+        Share of the shrinkage (%) to regain for recovery.
+    max_duration : int
+        Maximum days over which shrinkage can occur.
+    min_duration : int
+        Minimum duration (days, start and end included) of an event.
+    rebound_tolerance : int
+        Max consecutive days of increase tolerated within an event.
+
+    Returns
+    -------
+    dict
+        'params', 'threshold', the last date seen, the days since the start
+        of the current scan ('dates', 'values', at most max_duration + 1),
+        the state of the scan ('scan': running minimum and its position,
+        consecutive increases, next position) and the open event, if any
+        ('event': start, minimum and recovery target).
+    """
+    amp = float(amp)
+    return {
+        "params": {
+            "min_shrink_pct": min_shrink_pct,
+            "recovery_pct": recovery_pct,
+            "max_duration": max_duration,
+            "min_duration": min_duration,
+            "rebound_tolerance": rebound_tolerance,
+        },
+        "threshold": None if np.isnan(amp) or amp == 0 else amp * (min_shrink_pct / 100.0),
+        "amp": amp,
+        "last_date": None,
+        "dates": [],
+        "values": [],
+        "scan": None,
+        "event": None,
+    }
+
+
+def restart_scan(state):
+    """Start the scan at the first buffered day."""
+    if state["values"]:
+        state["scan"] = {"min_val": state["values"][0], "min_idx": 0, "increases": 0, "next": 1}
+    else:
+        state["scan"] = None
+
+
+def event_alert(alert, event, date, amp):
+    """Alert record of an event."""
+    return {
+        "alert": alert,
+        "date": date,
+        "start": event["start_date"],
+        "stop": event["stop_date"],
+        "start_D_mean": event["start_val"],
+        "stop_D_mean": event["stop_val"],
+        "min_D_mean": event["min_val"],
+        "total_shrink": event["start_val"] - event["stop_val"],
+        "shrink_pct": (event["start_val"] - event["stop_val"]) / amp * 100,
+        "recovery_target": event["recovery_target"],
+    }
+
+
+def advance_scan(state):
+    """
+    Process the buffered days with the scan from the first buffered day until
+    it records an event, fails (rebound or max_duration exceeded; the scan
+    then restarts at the next day) or needs more days.
+
+    Returns
+    -------
+    list of dict
+        'start' alerts of detected events (and 'recovery' alerts of events
+        that recovered within the buffered days).
+    """
+    params = state["params"]
+    dates, values = state["dates"], state["values"]
+    alerts = []
+
+    while state["scan"] is not None and state["scan"]["next"] < len(values):
+        scan = state["scan"]
+        j = scan["next"]
+        failed = False
+
+        if j > params["max_duration"]:
+            failed = True
+        elif values[j] < scan["min_val"]:
+            scan["min_val"], scan["min_idx"], scan["increases"] = values[j], j, 0
+        elif values[j] > values[j - 1]:
+            scan["increases"] += 1
+            failed = scan["increases"] > params["rebound_tolerance"]
+        else:
+            scan["increases"] = 0
+
+        if failed:
+            del dates[0], values[0]
+            restart_scan(state)
+            continue
+
+        scan["next"] = j + 1
+        min_idx = scan["min_idx"]
+        if values[0] - scan["min_val"] < state["threshold"] or min_idx + 1 < params["min_duration"]:
+            continue
+
+        # event detected: it starts at the maximum before the minimum
+        start = int(np.argmax(values[:min_idx])) if min_idx > 0 else 0
+        shrinkage = values[start] - scan["min_val"]
+        event = {
+            "start_date": dates[start],
+            "start_val": values[start],
+            "stop_date": dates[min_idx],
+            "stop_val": scan["min_val"],
+            "min_val": scan["min_val"],
+            "recovery_target": scan["min_val"] + shrinkage * params["recovery_pct"] / 100.0,
+        }
+        alerts.append(event_alert("start", event, dates[j], state["amp"]))
+
+        # days after the minimum that are already buffered
+        later_dates, later_values = dates[min_idx + 1:], values[min_idx + 1:]
+        state["dates"], state["values"], state["scan"] = [], [], None
+        state["event"] = event
+        for date, value in zip(later_dates, later_values):
+            alerts += update_stream_state(state, date, value, _replay=True)
+        break
+
+    return alerts
+
+
+def update_stream_state(state, date, value, _replay=False):
+    """
+    Feed the D_mean of one new day to the detector state of an id.
+
+    Parameters
+    ----------
+    state : dict
+        Detector state (see new_stream_state); updated in place.
+    date : str
+        ISO date of the day. Days up to the last date seen are ignored, so
+        overlapping updates can be fed again.
+    value : float
+        D_mean of the day; missing values are skipped.
+
+    Returns
+    -------
+    list of dict
+        Alerts of the day: 'start' when an event is detected, 'minimum' when
+        an open event reaches a new minimum and 'recovery' when it recovers.
+    """
+    if not _replay:
+        if state["last_date"] is not None and date <= state["last_date"]:
+            return []
+        state["last_date"] = date
+    if value is None or np.isnan(value) or state["threshold"] is None:
+        return []
+    value = float(value)
+
+    event = state["event"]
+    if event is not None:
+        if value >= event["recovery_target"]:
+            state["event"] = None
+            return [event_alert("recovery", event, date, state["amp"])]
+        if value < event["min_val"]:
+            event["min_val"] = value
+            return [event_alert("minimum", event, date, state["amp"])]
+        return []
+
+    state["dates"].append(date)
+    state["values"].append(value)
+    if state["scan"] is None:
+        restart_scan(state)
+    return advance_scan(state)
+
+
+def stream_updates(states, df, group_col="id", date_col="date", value_col="D_mean", **params):
+    """
+    Feed new daily values of many ids to their detector states.
+
+    Parameters
+    ----------
+    states : dict
+        id -> detector state; states of new ids are created with params.
+    df : pd.DataFrame
+        New daily values with an 'amp' column (used for new ids), sorted by date.
+    group_col, date_col, value_col : str
+        Names of the id, date and value columns.
+    **params
+        Parameters of new_stream_state for new ids.
+
+    Returns
+    -------
+    pd.DataFrame
+        All alerts with the id.
+    """
+    alerts = []
+    dates = pd.to_datetime(df[date_col]).dt.strftime("%Y-%m-%d")
+    for id_value, day, value, amp in zip(df[group_col], dates, df[value_col], df["amp"]):
+        if id_value not in states:
+            states[id_value] = new_stream_state(amp, **params)
+        alerts += [{"id": id_value, **alert} for alert in update_stream_state(states[id_value], day, value)]
+
+    columns = ["id", "alert", "date", "start", "stop", "start_D_mean", "stop_D_mean",
+               "min_D_mean", "total_shrink", "shrink_pct", "recovery_target"]
+    return pd.DataFrame(alerts, columns=columns)
+
+
+def load_stream_states(path):
+    """Load the detector states of all ids (empty if the file does not exist yet)."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_stream_states(states, path):
+    """Store the detector states of all ids as JSON."""
+    with open(path, "w") as f:
+        json.dump(states, f)
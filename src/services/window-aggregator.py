@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+
+exec(open('src/services/range-query.py').read())
+
+
+def build_window_index(df, columns, group_col="id", date_col="date"):
+    """
+    Build the structures that answer window aggregates of the given columns
+    for any id and date window: per column the cumulative sums and counts of
+    the valid values. The sparse tables of the range minima and maxima are
+    built on the first query of 'min'/'time_min' or 'max' of a column (see
+    cached_sparse_table). All ids are packed into one array, sorted by id and
+    date.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Long-format dataframe with one row per id and date.
+    columns : list of str
+        Columns to aggregate (e.g. ['AT_mean', 'ST_mean', 'SM_mean']).
+    group_col, date_col : str
+        Names of the id and date columns.
+
+    Returns
+    -------
+    dict
+        'keys' (index of the ids), 'offsets' (rows of id k are
+        offsets[k] to offsets[k + 1] - 1), 'dates' and per column the
+        structures under 'columns'.
+    """
+    df = df.sort_values([group_col, date_col])
+    groups = df[group_col].to_numpy()
+    starts = np.flatnonzero(groups[1:] != groups[:-1]) + 1
+    offsets = np.concatenate([[0], starts, [len(groups)]]).astype(np.int64) if len(groups) else np.zeros(1, dtype=np.int64)
+
+    index = {
+        "keys": pd.Index(groups[offsets[:-1]]),
+        "offsets": offsets,
+        "dates": df[date_col].to_numpy(dtype="datetime64[ns]"),
+        "columns": {},
+    }
+    for col in columns:
+        values = df[col].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        dtype = df[col].dtype
+        index["columns"][col] = {
+            "dtype": dtype if isinstance(dtype, np.dtype) and dtype.kind == "f" else np.dtype(float),
+            "sum": np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))]),
+            "count": np.concatenate([[0], np.cumsum(valid)]),
+            "values": values,
+        }
+    return index
+
+
+def window_bounds(index, ids, anchors, n_days):
+    """
+    Rows of the windows [anchor - n_days, anchor) of every id and anchor date.
+
+    Returns
+    -------
+    lo, hi : np.ndarray
+        The window of query i holds the rows lo[i] to hi[i] - 1 (empty for
+        unknown ids).
+    """
+    anchors = np.asarray(anchors, dtype="datetime64[ns]")
+    series = index["keys"].get_indexer(ids)
+    lo = np.zeros(len(anchors), dtype=np.int64)
+    hi = np.zeros(len(anchors), dtype=np.int64)
+
+    for k in np.unique(series[series >= 0]):
+        rows = np.flatnonzero(series == k)
+        first, last = index["offsets"][k], index["offsets"][k + 1]
+        dates = index["dates"][first:last]
+        lo[rows] = first + np.searchsorted(dates, anchors[rows] - np.timedelta64(n_days, "D"), side="left")
+        hi[rows] = first + np.searchsorted(dates, anchors[rows], side="left")
+    return lo, hi
+
+
+window_functions = ("sum", "mean", "max", "min", "time_min")
+
+
+def window_statistics(index, col, lo, hi, functions=window_functions, anchors=None):
+    """
+    Several statistics of a column over many windows at once, from a single
+    resolution of the windows: the counts and sums are looked up once and
+    the range minimum once for both 'min' and 'time_min'. Each statistic
+    takes O(1) per window ('time_min' O(log n)). Missing values are skipped
+    as in pandas.
+
+    Parameters
+    ----------
+    index : dict
+        Output of build_window_index.
+    col : str
+        Column to aggregate.
+    lo, hi : np.ndarray
+        Windows (see window_bounds).
+    functions : sequence of str
+        Statistics among 'sum' (0 for empty windows), 'mean', 'max', 'min'
+        and 'time_min' (days from the first minimum of the window to the
+        anchor date).
+    anchors : np.ndarray or None
+        Anchor dates, needed for 'time_min'.
+
+    Returns
+    -------
+    pd.DataFrame
+        One column per statistic and one row per window, NaN where the window
+        has no valid values (except for 'sum'). 'sum', 'mean', 'max' and
+        'min' have the dtype of the column, 'time_min' is integer unless a
+        window has no values.
+    """
+    invalid = [function for function in functions if function not in window_functions]
+    if invalid:
+        raise ValueError(f"Invalid function {invalid[0]}. Choose from {', '.join(window_functions)}.")
+
+    structures = index["columns"][col]
+    lo = np.asarray(lo, dtype=np.int64)
+    hi = np.asarray(hi, dtype=np.int64)
+    count = structures["count"][hi] - structures["count"][lo]
+    has_values = np.flatnonzero(count > 0)
+    dtype = structures["dtype"]
+
+    def extreme(table, op):
+        val = np.full(len(lo), np.nan)
+        val[has_values] = range_query(table, lo[has_values], hi[has_values] - 1, op=op)
+        return val
+
+    results = {}
+    if "sum" in functions or "mean" in functions:
+        total = structures["sum"][hi] - structures["sum"][lo]
+        if "sum" in functions:
+            results["sum"] = total.astype(dtype)
+        if "mean" in functions:
+            mean = np.full(len(lo), np.nan)
+            mean[has_values] = total[has_values] / count[has_values]
+            results["mean"] = mean.astype(dtype)
+    if "max" in functions:
+        results["max"] = extreme(cached_sparse_table(structures, np.maximum), np.maximum).astype(dtype)
+    if "min" in functions or "time_min" in functions:
+        min_table = cached_sparse_table(structures)
+        minimum = extreme(min_table, np.minimum)
+        if "min" in functions:
+            results["min"] = minimum.astype(dtype)
+        if "time_min" in functions:
+            # position of the first minimum of every window
+            window_min = minimum[has_values]
+            first = first_index(
+                min_table, lo[has_values], hi[has_values] - 1,
+                lambda m, rows: m <= window_min[rows]
+            )
+            anchors = np.asarray(anchors, dtype="datetime64[ns]")
+            time_min = np.full(len(lo), np.nan)
+            time_min[has_values] = (anchors[has_values] - index["dates"][first]) // np.timedelta64(1, "D")
+            # whole days, as integers unless a window has no values
+            results["time_min"] = time_min.astype(np.int64) if len(has_values) == len(lo) else time_min
+
+    return pd.DataFrame({function: results[function] for function in functions})
+
+
+def window_aggregate(index, col, lo, hi, function="sum", anchors=None):
+    """
+    A single statistic of a column over many windows (see window_statistics).
+
+    Returns
+    -------
+    np.ndarray
+        One value per window.
+    """
+    return window_statistics(index, col, lo, hi, [function], anchors)[function].to_numpy()
@@ -0,0 +1,66 @@
+import os
+import pandas as pd
+import numpy as np
+
+exec(open('src/services/data-store.py').read())
+exec(open('src/services/database.py').read())
+exec(open('src/services/streaming-detector.py').read())
+
+# Parameters (outer events of shrinking-events.jl)
+min_shrink_pct = 10.0   # Minimum shrinkage as % of individual amplitude
+max_duration = 60       # Maximum days over which shrinkage can occur
+min_duration = 2        # Minimum duration to count as an event
+rebound_tolerance = 15  # Max consecutive days of increase tolerated within event
+recovery_pct = 95.0     # Share of the shrinkage (%) to regain for recovery
+
+# Detector state of every id, kept between runs
+state_path = "input/shrinking-stream-state.json"
+
+states = load_stream_states(state_path)
+known_ids = list(states)
+since = min((state["last_date"] for state in states.values() if state["last_date"]), default="0001-01-01")
+
+# New complete days since the last run (all days of new ids). The last day of
+# every id may still receive measurements and is left for the next run. The
+# amplitude of new ids is taken from all their days so far.
+con = connect_database(read_only=True)
+df = con.execute("""
+    WITH days AS (
+        SELECT id,
+               CAST(period AS DATE) AS date,
+               D_mean,
+               MAX(D_mean) OVER (PARTITION BY id) - MIN(D_mean) OVER (PARTITION BY id) AS amp,
+               MAX(period) OVER (PARTITION BY id) AS last_period,
+               period
+        FROM aggregates_daily
+    )
+    SELECT id, date, D_mean, amp
+    FROM days
+    WHERE period < last_period
+      AND (CAST(period AS DATE) > CAST(? AS DATE) OR NOT list_contains(?, id))
+    ORDER BY date, id
+""", [since, known_ids]).df()
+con.close()
+
+print(f"{len(df)} new days for {df['id'].nunique()} IDs")
+
+alerts = stream_updates(
+    states, df,
+    min_shrink_pct=min_shrink_pct,
+    recovery_pct=recovery_pct,
+    max_duration=max_duration,
+    min_duration=min_duration,
+    rebound_tolerance=rebound_tolerance
+)
+save_stream_states(states, state_path)
+
+open_events = sum(state["event"] is not None for state in states.values())
+print(f"\n{len(alerts)} new alerts, {open_events} IDs in an open shrinking event")
+
+if len(alerts) > 0:
+    print(alerts)
+
+    # Append to the alerts of earlier runs
+    if os.path.isdir(store_path("shrinking_alerts")):
+        alerts = pd.concat([load_table("shrinking_alerts"), alerts], ignore_index=True)
+    write_table(alerts, "shrinking_alerts", partition_cols=())
@@ -0,0 +1,65 @@
+import os
+import pandas as pd
+import numpy as np
+
+exec(open('src/services/event-cache.py').read())
+
+# Parameters for outer events (depth 0)
+min_shrink_pct = 10.0   # Minimum shrinkage as % of individual amplitude
+max_duration = 60       # Maximum days over which shrinkage can occur
+min_duration = 2        # Minimum duration to count as an event
+rebound_tolerance = 15  # Max consecutive days of increase tolerated within event
+recovery_pct = 95.0     # Share of the shrinkage (%) to regain for recovery
+
+# Parameters for nested events (depth 1+)
+nested_min_shrink_pct = 15.0
+nested_recovery_pct = 80.0
+max_nesting_depth = 10
+
+n_workers = os.cpu_count()  # Worker processes for event detection (1: run in this process)
+
+
+# Detect events and, within the recovery phase of every event, the events
+# nested in it, up to max_nesting_depth (see detect_nested_events in
+# src/services/shrinking-detector.py; same output as shrinking-events.jl).
+# Events of IDs whose data did not change are taken from the event cache
+# (see src/services/event-cache.py).
+print(f"Detecting shrinking events (max depth: {max_nesting_depth})...")
+print(f"Outer events: min_shrink_pct={min_shrink_pct}%, recovery_pct={recovery_pct}%")
+print(f"Nested events: min_shrink_pct={nested_min_shrink_pct}%, recovery_pct={nested_recovery_pct}%")
+
+events_df = load_shrinking_events(
+    min_shrink_pct=min_shrink_pct,
+    recovery_pct=recovery_pct,
+    nested_min_shrink_pct=nested_min_shrink_pct,
+    nested_recovery_pct=nested_recovery_pct,
+    max_nesting_depth=max_nesting_depth,
+    max_duration=max_duration,
+    min_duration=min_duration,
+    rebound_tolerance=rebound_tolerance,
+    n_workers=n_workers
+)
+
+print(f"\nDetection complete!")
+print(f"Total events detected: {len(events_df)}")
+
+if len(events_df) > 0:
+    print("\nEvents by depth:")
+    for depth, group in events_df.groupby("depth"):
+        print(f"  Depth {depth} ({group['event_type'].iloc[0]}): {len(group)} events")
+        print(f"    Mean duration: {group['shrink_days'].mean():.1f} days")
+        print(f"    Mean shrinkage: {group['shrink_pct'].mean():.1f}%")
+
+    print("\nOverall statistics:")
+    print(f"Mean shrinking duration: {events_df['shrink_days'].mean():.1f} days")
+    print(f"Mean total duration (to recovery): {events_df['total_days'].mean():.1f} days")
+    print(f"Mean shrinkage: {events_df['shrink_pct'].mean():.1f}% of amplitude")
+
+    print("\nSample of detected events:")
+    print(events_df.head(15))
+
+    # Save results
+    events_df.to_csv("input/shrinking-events.csv", index=False, date_format="%Y-%m-%d")
+    print("\nResults saved to input/shrinking-events.csv")
+else:
+    print("\nNo events detected.")
@@ -0,0 +1,50 @@
+import pandas as pd
+import numpy as np
+
+exec(open('src/services/data-store.py').read())
+exec(open('src/services/parameter-sweep.py').read())
+
+# Parameter grids; every combination is evaluated in one run
+shrinking_grid = parameter_grid(
+    min_shrink_pct=[5, 10, 15, 20],
+    max_duration=[15, 30, 60],
+    min_duration=[2, 3, 5],
+    rebound_tolerance=[1, 3, 5],
+)
+
+nested_grid = parameter_grid(
+    min_shrink_pct=[5.0, 10.0, 15.0],
+    recovery_pct=[80.0, 90.0, 95.0],
+    nested_min_shrink_pct=[10.0, 15.0, 20.0],
+    nested_recovery_pct=[70.0, 80.0, 90.0],
+    max_nesting_depth=10,
+    max_duration=60,
+    min_duration=2,
+    rebound_tolerance=15,
+)
+
+# Load and prepare data
+df = load_table("daily_data_with_trends", columns=["id", "date", "D_mean", "normalized"])
+df = df.dropna(subset=["D_mean"])
+df = df.sort_values(["id", "date"], ignore_index=True)
+
+prepared = prepare_sweep(df)
+offsets = prepared["offsets"]
+
+# Amplitudes as in src/shrinking-events.py (normalized) and shrinking-events.jl (D_mean)
+by_id = df.groupby("id", observed=True, sort=False)
+normalized_amps = (by_id["normalized"].transform("max") - by_id["normalized"].transform("min")).to_numpy()[offsets[:-1]]
+d_mean_amps = (by_id["D_mean"].transform("max") - by_id["D_mean"].transform("min")).to_numpy()[offsets[:-1]]
+
+print(f"Data loaded: {len(df)} rows for {len(offsets) - 1} unique IDs")
+
+print(f"\nShrinking events: {len(shrinking_grid)} parameter combinations")
+shrinking_sweep = sweep_shrinking_events(prepared, normalized_amps, shrinking_grid)
+print(shrinking_sweep)
+
+print(f"\nNested shrinking events: {len(nested_grid)} parameter combinations")
+nested_sweep = sweep_nested_events(prepared, d_mean_amps, nested_grid)
+print(nested_sweep)
+
+write_table(shrinking_sweep, "shrinking_events_sweep", partition_cols=())
+write_table(nested_sweep, "nested_shrinking_events_sweep", partition_cols=())
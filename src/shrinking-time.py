@@ -2,25 +2,18 @@ import pandas as pd
 import plotly.graph_objects as go
 
 exec(open('src/constants/palettes.py').read())
+exec(open('src/services/data-store.py').read())
 
-df = pd.read_csv("input/daily_data_with_trends.csv")
-df["date"] = pd.to_datetime(df["date"])
+df = load_daily_table(columns=["id", "date", "D_mean"])
 df = df.sort_values(["id", "date"])
 
-df["year"] = df["date"].dt.year
-df["week"] = df["date"].dt.isocalendar().week
-df["month"] = df["date"].dt.month
-df["doy"] = df["date"].dt.dayofyear
-df["group"] = df["id"] + " " + df["year"].astype(str) + " " + df["week"].astype(str)
 df = df.dropna(subset=["D_mean"])
 print(df.head())
 
-df["change"] = df.groupby("id")["D_mean"].diff()
-weekly_total_change = df.groupby("group")["change"].sum().reset_index()
-weekly_total_change["date"] = pd.to_datetime(weekly_total_change["group"].str.split(" ").str[1] + "-" + weekly_total_change["group"].str.split(" ").str[2] + "-1", format="%Y-%W-%w")
+df["change"] = df.groupby("id", observed=True)["D_mean"].diff()
+weekly_total_change = df.groupby(["id", "year", "week"], observed=True)["change"].sum().reset_index()
+weekly_total_change["date"] = pd.to_datetime(weekly_total_change["year"].astype(str) + "-" + weekly_total_change["week"].astype(str) + "-1", format="%Y-%W-%w")
 weekly_total_change["year"] = weekly_total_change["date"].dt.year
-weekly_total_change["week"] = weekly_total_change["group"].str.split(" ").str[2].astype(int)
-weekly_total_change["id"] = weekly_total_change["group"].str.split(" ").str[0]
 
 min_weekly_change = weekly_total_change[weekly_total_change["change"] < -40]
 
@@ -45,27 +38,27 @@ for _, row in min_weekly_change.iterrows():
     else:
         print(f"Warning: No data for id={id_val}, year={year_val}, week={week_val}")
 
-result_df = pd.DataFrame(result)
-result_df.to_csv("input/shrinking-time.csv", index=False)
-print(result_df)
+result_df = pd.DataFrame(result, columns=["id", "year", "week", "min_weekly_change", "date_of_min_daily_change", "min_daily_change"])
+if result_df.empty:
+    print("No week with a total change below -40")
+else:
+    print(result_df)
+write_table(add_partition_columns(result_df), "shrinking_time")
 
 # Calculate cumulative change for each id
-df["cum_change"] = df.groupby("id")["change"].transform("cumsum")
+df["cum_change"] = df.groupby("id", observed=True)["change"].transform("cumsum")
 
-first_val = df.groupby("id")["D_mean"].transform(lambda s: s.dropna().iloc[0] if s.notna().any() else float("nan"))
-df["D_base"] = df["D_mean"] - first_val
+# growth (GRO), tree water deficit (TWD) and cumulative shrinking from create-twd-data.py
+twd = load_daily_table("twd_data", columns=["id", "date", "D_base", "GRO", "TWD", "cum_neg_change"])
+df = df.merge(twd[["id", "date", "D_base", "GRO", "TWD", "cum_neg_change"]], on=["id", "date"], how="left")
 
-df["cum_pos_change"] = df.groupby("id")["D_base"].transform("cummax") 
-
-df["cum_neg_change"] = df.groupby("id")["D_base"].transform("cummin")
-
-df.to_csv("input/daily_data_with_cumulative.csv", index=False)
+write_table(add_partition_columns(df), "daily_data_with_cumulative")
 
 bgcolor = 'white'
 textcolor = palette2[1]
     
 fig = go.Figure()
-for id_val, g in df.groupby("id"):
+for id_val, g in df.groupby("id", observed=True):
     fig.add_trace(go.Scatter(
         x=g["date"],
         y=g["D_base"],          
@@ -86,7 +79,7 @@ for id_val, g in df.groupby("id"):
     ))
     fig.add_trace(go.Scatter(
         x=g["date"],
-        y=g["cum_pos_change"],          
+        y=g["GRO"],          
         mode="lines",
         name=str(id_val) + " " + "cum growth",        
         showlegend=True,
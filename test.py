@@ -1,8 +1,12 @@
+import numpy as np
 import pandas as pd
 from datetime import timedelta
 
-df = pd.read_csv("input/daily_data_with_trends.csv")
-df["date"] = pd.to_datetime(df["date"])
+exec(open('src/services/data-store.py').read())
+exec(open('src/services/shrinking-detector.py').read())
+exec(open('src/services/parallel-detection.py').read())
+
+df = load_table("daily_data_with_trends", columns=["id", "date", "D_mean"])
 df = df.sort_values(["id", "date"])
 
 df["year"] = df["date"].dt.year
@@ -25,54 +29,63 @@ def detect_shrinking_events(
     """
     Detect shrinking events inside a single-ID DataFrame.
     DataFrame must contain: date (datetime64) and D_mean.
+    The maximum since the first day and the minimum since the event start
+    are kept while scanning, so the days are visited once.
     """
 
-    g = df.sort_values("date").reset_index(drop=True)
+    g = df.sort_values("date")
+    dates = g["date"].to_numpy(dtype="datetime64[ns]")
+    day_ns = np.timedelta64(1, "D") // np.timedelta64(1, "ns")
+    times = dates.view(np.int64).tolist()
+    values = g["D_mean"].to_numpy(dtype=float).tolist()
+
+    events = []
+    if len(values) < 2:
+        return pd.DataFrame(events)
 
     # amplitude for this ID
-    amp = g["D_mean"].max() - g["D_mean"].min()
+    amp = max(values) - min(values)
 
     # thresholds
     drop_thr = drop_threshold_pct * amp
     rise_thr = rise_threshold_pct * amp
 
-    # daily change
-    g["diff"] = g["D_mean"].diff()
-
-    events = []
     in_event = False
     start_idx = None
+    running_max = values[0]   # maximum since the first day
+    event_max = None          # maximum up to the event start
+    event_min = None          # minimum since the event start
     last_negative_day = None
     positive_streak = 0
-    
-    for i in range(1, len(g)):
-        d = g.loc[i, "diff"]
+
+    for i in range(1, len(values)):
+        value = values[i]
+        running_max = max(running_max, value)
 
         # Case 1: we are NOT yet inside an event → check for start
         if not in_event:
             # condition: cumulative drop from the local max
-            window = g.loc[:i, "D_mean"]
-            local_max = window.max()
-            cumulative_drop = local_max - g.loc[i, "D_mean"]
-
-            if cumulative_drop >= drop_thr:
+            if running_max - value >= drop_thr:
                 in_event = True
                 start_idx = i
-                last_negative_day = g.loc[i, "date"]
+                event_max = running_max
+                event_min = value
+                last_negative_day = times[i]
                 positive_streak = 0
             continue
 
         # Case 2: we ARE inside an event
-        if d < 0:
+        event_min = min(event_min, value)
+        if value - values[i - 1] < 0:
             # negative day → update trackers
-            last_negative_day = g.loc[i, "date"]
+            last_negative_day = times[i]
             positive_streak = 0
         else:
             # positive day
             positive_streak += 1
 
         # Check if event continues
-        gap_days = (g.loc[i, "date"] - last_negative_day).days
+        gap_days = (times[i] - last_negative_day) // day_ns
 
         still_shrinking = (
             gap_days <= max_gap_days and positive_streak <= max_positive_run
@@ -82,16 +95,14 @@ def detect_shrinking_events(
             continue
 
         # Check if it rose enough to end shrinking period
-        window = g.loc[start_idx:i, "D_mean"]
-        local_min = window.min()
-        rise_amount = g.loc[i, "D_mean"] - local_min
+        rise_amount = value - event_min
 
         if rise_amount >= rise_thr:
             events.append(
                 {
-                    "start": g.loc[start_idx, "date"],
-                    "end": g.loc[i, "date"],
-                    "drop_amount": local_max - local_min if "local_max" in locals() else None,
+                    "start": dates[start_idx],
+                    "end": dates[i],
+                    "drop_amount": event_max - event_min,
                 }
             )
             in_event = False
@@ -99,79 +110,92 @@ def detect_shrinking_events(
 
     # close last event if needed
     if in_event:
-        end_idx = len(g) - 1
-        window = g.loc[start_idx:end_idx, "D_mean"]
-        local_min = window.min()
-        local_max = g.loc[:start_idx, "D_mean"].max()
         events.append(
             {
-                "start": g.loc[start_idx, "date"],
-                "end": g.loc[end_idx, "date"],
-                "drop_amount": local_max - local_min,
+                "start": dates[start_idx],
+                "end": dates[-1],
+                "drop_amount": event_max - event_min,
             }
         )
 
     return pd.DataFrame(events)
 
 
-def classify_outer_inner(event_df):
+def classify_outer_inner_batch(event_df, group_col="series"):
     """
-    Adds columns:
+    Adds columns to the events of all groups (e.g. IDs) at once:
     - type: 'outer' or 'inner'
-    - outer_event_id: grouping variable
+    - outer_event_id: grouping variable, numbered within each group
+
+    An event is inner if another event of its group contains it; it belongs
+    to the outer event of the first such event in (start, end) order.
+    Sorted by start, the first earlier event that contains event i is the
+    first one whose end reaches the end of i, found by a binary search on the
+    running maximum of the ends (O(E log E)). A later event can only contain
+    i if it starts on the same day.
     """
 
     if event_df.empty:
         return event_df
 
-    event_df = event_df.sort_values(["start", "end"]).reset_index(drop=True)
+    event_df = event_df.sort_values([group_col, "start", "end"]).reset_index(drop=True)
 
-    outer_id = 0
-    event_df["type"] = None
-    event_df["outer_event_id"] = None
+    groups = event_df[group_col].to_numpy()
+    starts = event_df["start"].to_numpy()
+    group_no = np.cumsum(np.r_[True, groups[1:] != groups[:-1]]) - 1
 
-    for i in range(len(event_df)):
-        s_i, e_i = event_df.loc[i, ["start", "end"]]
+    # ranks of the end dates, so (group, running max of the ends) is one increasing integer key
+    n = len(event_df)
+    end_rank = np.unique(event_df["end"].to_numpy(), return_inverse=True)[1]
+    running_max = pd.Series(end_rank).groupby(group_no).cummax().to_numpy()
+    container = np.searchsorted(group_no * (n + 1) + running_max, group_no * (n + 1) + end_rank)
 
-        # check if contained
-        containing = [
-            j for j in range(len(event_df))
-            if j != i
-            and event_df.loc[j, "start"] <= s_i
-            and event_df.loc[j, "end"] >= e_i
-        ]
+    has_container = container < np.arange(n)
+    same_start_next = np.r_[(group_no[1:] == group_no[:-1]) & (starts[1:] == starts[:-1]), False]
+    is_outer = ~has_container & ~same_start_next
 
-        if containing:
-            # inner event
-            parent = containing[0]
-            event_df.loc[i, "type"] = "inner"
-            event_df.loc[i, "outer_event_id"] = event_df.loc[parent, "outer_event_id"]
-        else:
-            # new outer event
-            event_df.loc[i, "type"] = "outer"
-            event_df.loc[i, "outer_event_id"] = outer_id
-            outer_id += 1
+    outer_event_id = np.full(n, None, dtype=object)
+    outer_event_id[is_outer] = pd.Series(is_outer).groupby(group_no).cumsum().to_numpy()[is_outer] - 1
+    # the first container has no earlier container itself, so its id is final
+    outer_event_id[has_container] = outer_event_id[container[has_container]]
+
+    event_df["type"] = np.where(is_outer, "outer", "inner").astype(object)
+    event_df["outer_event_id"] = outer_event_id
 
     return event_df
 
 
-def process_all_ids(df, **kwargs):
+def classify_outer_inner(event_df):
     """
-    Apply shrinking event detection to every ID in the dataset.
+    Adds columns:
+    - type: 'outer' or 'inner'
+    - outer_event_id: grouping variable
+    (see classify_outer_inner_batch)
+    """
+
+    if event_df.empty:
+        return event_df
+
+    return classify_outer_inner_batch(event_df.assign(_group=0), group_col="_group").drop(columns="_group")
+
+
+def detect_events_packed(dates, values, offsets, **kwargs):
+    """
+    Apply shrinking event detection to every packed series (see pack_series).
     """
 
     all_events = []
 
-    for id_, g in df.groupby("id"):
+    for k in range(len(offsets) - 1):
+        g = pd.DataFrame({
+            "date": dates[offsets[k]:offsets[k + 1]],
+            "D_mean": values[offsets[k]:offsets[k + 1]],
+        })
         ev = detect_shrinking_events(g, **kwargs)
         if ev.empty:
             continue
 
-        ev = classify_outer_inner(ev)
-        ev["id"] = id_
-        ev["start_doy"] = ev["start"].dt.dayofyear
-        ev["end_doy"] = ev["end"].dt.dayofyear
-
+        ev["series"] = k
         all_events.append(ev)
 
     if not all_events:
@@ -179,6 +203,27 @@ def process_all_ids(df, **kwargs):
 
     return pd.concat(all_events, ignore_index=True)
 
+
+def process_all_ids(df, n_workers=None, **kwargs):
+    """
+    Apply shrinking event detection to every ID in the dataset,
+    with the IDs sharded across n_workers processes (default: all cores).
+    """
+
+    ids, dates, values, offsets = pack_series(df)
+    events = detect_events_parallel(detect_events_packed, dates, values, offsets, n_workers=n_workers, **kwargs)
+
+    if events.empty:
+        return pd.DataFrame()
+
+    events = classify_outer_inner_batch(events, group_col="series")
+
+    events["id"] = ids[events.pop("series")]
+    events["start_doy"] = events["start"].dt.dayofyear
+    events["end_doy"] = events["end"].dt.dayofyear
+
+    return events
+
 events = process_all_ids(
     df,
     drop_threshold_pct=0.1,  # shrinking begins after 3% amplitude drop